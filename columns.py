@@ -1,97 +1,220 @@
-import pygame
 import random
 import math
-import project4_game
+import columns_game
+import columns_timing
+import columns_metrics
+import columns_ai
+import columns_replay
 
 
-# Hardcoded frame rate, width, height, background color, empty grid color,
-# and size of the cells.
+# Default frame rate, tick rate (moves per second), and board size, the
+# background color, empty grid color, the space each cell takes in the
+# window and the size of the jewel drawn in it, and the largest starting
+# window. Boards whose cells wouldn't fit in that window start with
+# smaller cells.
 _FRAME_RATE = 30
-_WIDTH = 276
-_HEIGHT = 598
-_BACKGROUND_COLOR = pygame.Color(0, 0, 0)
-_GRID_COLOR = pygame.Color(70, 70, 70)
+_TICK_RATE = 1
+_ROWS = 13
+_COLUMNS = 6
+_BACKGROUND_COLOR = (0, 0, 0)
+_GRID_COLOR = (70, 70, 70)
+_CELL_SIZE = 46
 _BLOCK_SIZE = 45
+_MAX_WINDOW = (1280, 960)
+# boards with more cells than this are drawn in one batch by default
+_BATCH_CELLS = 2000
+
+# pygame is only imported when a game is run, so the game model and the
+# headless tools can import this module without loading SDL. NumPy and
+# columns_array are only imported for drawing in one batch.
+pygame = None
+columns_array = None
+
+
+def _import_pygame() -> None:
+    global pygame
+    import pygame
+
+
+def _import_columns_array() -> None:
+    global columns_array
+    import columns_array
+
 
 class ColumnsGame:
-    def __init__(self):
+    def __init__(self, dirty_rects: bool = False, tick_rate: float = _TICK_RATE,
+                 frame_rate: int = _FRAME_RATE, vsync: bool = False,
+                 metrics: columns_metrics.Metrics = None, undo_limit: int = 0,
+                 attract: bool = False, seed: int = None, record=None,
+                 rows: int = _ROWS, columns: int = _COLUMNS,
+                 game_class: type = columns_game.Game, batch_draw: bool = None,
+                 max_lag: float = 0.25):
+        # if dirty_rects is True, each frame only redraws the cells that
+        # changed since the last frame instead of the whole board.
+        # tick_rate is how many times a second the game moves, and
+        # frame_rate is how many frames are drawn a second; a frame_rate
+        # of 0 draws as fast as possible. With vsync, frames are drawn in
+        # step with the display instead. If metrics is given, the game and
+        # the drawing are timed into it and shown in the corner. With an
+        # undo_limit, the Z key steps back through that many moves. In
+        # attract mode the computer plays, one input per frame. Fallers are
+        # picked with a generator seeded with seed, or a random seed if it
+        # is None. If record is given, the session is recorded into it, a
+        # path or an open binary file, for columns_replay.ReplayPlayer.
+        # The board is rows by columns and played on a game_class, such as
+        # columns_array.ArrayGame for big boards. With batch_draw, each
+        # frame is drawn as one pixel per cell and scaled to the window,
+        # which keeps up on big boards but leaves out the grid lines and
+        # dirty rects; None turns it on for boards of more than
+        # _BATCH_CELLS cells. After a stall, at most max_lag seconds of
+        # missed ticks are caught up.
         self._running = True
-        self._game = project4_game.Game(13, 6, ['EMPTY'])
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self._seed = seed
+        self._random = random.Random(seed)
+        self._record = record
+        self._undo_limit = undo_limit
+        self._game = game_class(rows, columns, ['EMPTY'], undo_limit=undo_limit)
+        if batch_draw is None:
+            batch_draw = rows * columns > _BATCH_CELLS
+        self._batch_draw = batch_draw
+        # the starting window size
+        cell_size = max(1, min(_CELL_SIZE, _MAX_WINDOW[0] // columns, _MAX_WINDOW[1] // rows))
+        self._width = cell_size * columns
+        self._height = cell_size * rows
+        self._block_size = cell_size * _BLOCK_SIZE / _CELL_SIZE
+        self._dirty_rects = dirty_rects
+        self._tick_rate = tick_rate
+        self._max_lag = max_lag
+        self._frame_rate = frame_rate
+        self._vsync = vsync
+        self._metrics = metrics
+        if attract:
+            self._player = columns_ai.AutoPlayer()
+        else:
+            self._player = None
+        self._overlay = None
+        self._overlay_time = None
+        if metrics is not None:
+            columns_metrics.instrument(self._game, metrics)
+            columns_metrics.instrument_method(self, '_redraw', metrics)
+        # the (color, state) of every cell as of the last frame drawn with
+        # dirty rects, or None if the next frame has to be drawn in full
+        self._last_frame = None
+        # where each cell is drawn in the window, and the pre-rendered
+        # cell tiles keyed by (color, state, tile size). Both are rebuilt
+        # when the window size changes.
+        self._cell_rects = None
+        self._tile_size = None
+        self._tiles = {}
+        # for drawing in one batch: the board surface with one pixel per
+        # cell, and the pixel color for each color byte and state
+        self._board_surface = None
+        self._palette = None
 
     def run(self) -> None:
+        _import_pygame()
+        if self._batch_draw:
+            _import_columns_array()
+        record_file = self._record
+        if isinstance(self._record, str):
+            record_file = open(self._record, 'wb')
+        recorder = None
+        if record_file is not None:
+            recorder = columns_replay.Recorder(
+                record_file, self._game.rows(), self._game.columns(), self._seed,
+                self._undo_limit, round(1_000_000_000 / self._tick_rate))
+            columns_replay.record(self._game, recorder)
         pygame.init()
         try:
 
-            # Creates surface and a copy of it. The game will be drawn on the
-            # copy, which will then be stretched using blit to scale with the
-            # screen size.
-            self._create_surface((_WIDTH, _HEIGHT))
+            # Creates the window. The game is drawn straight onto it, with
+            # cells placed to scale with the window size.
+            self._create_surface((self._width, self._height))
 
-            self._drawing_surface = self._surface.copy()
-            
             clock = pygame.time.Clock()
-            k = 0
+            scheduler = columns_timing.FixedStepScheduler(self._tick_rate, self._max_lag)
+            scheduler.ticks_due()
+            self._add_faller_if_needed()
             while self._running:
-                clock.tick(30)
-                # Every second, "move" the game (i.e. make faller go down one
-                # cell, find matches, etc.)
-                if math.floor(pygame.time.get_ticks() / 1000) > k:
-                    k += 1
+                if self._vsync or self._frame_rate == 0:
+                    clock.tick()
+                else:
+                    clock.tick(self._frame_rate)
+                # "move" the game (i.e. make faller go down one cell, find
+                # matches, etc.) once for every tick that has come due
+                # since the last frame
+                for tick in range(scheduler.ticks_due()):
                     self._game.move()
-                # if there is no faller current, check for matches, and if there
-                # are no matches, add a new faller
-                if not self._game.faller_exists():
-                    if self._game._check_for_matches():
-                        pass
-                    else:
-                        self._add_faller_to_random_clear_column()
+                    self._add_faller_if_needed()
+                if self._player is not None:
+                    self._apply_input(self._player.next_input(self._game))
                 self._handle_events()
                 self._redraw()
-        except project4_game.GameOverError:
+        except columns_game.GameOverError:
             # Catch the game over error created in the model of the game, and
             # displays "GAME OVER" for 3 seconds before closing the game window
             self._game_over_screen()
             pygame.time.delay(3000)
             pass
         finally:
+            if recorder is not None:
+                recorder.close()
+                if record_file is not self._record:
+                    record_file.close()
             pygame.quit()
         
     def _create_surface(self, size: tuple[int, int]) -> None:
-        self._surface = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self._surface = pygame.display.set_mode(size, pygame.RESIZABLE,
+                                                vsync=1 if self._vsync else 0)
+
+    def _add_faller_if_needed(self) -> None:
+        # if there is no faller current, check for matches, and if there
+        # are no matches, add a new faller
+        if not self._game.faller_exists():
+            if self._game.has_matches():
+                pass
+            else:
+                self._add_faller_to_random_clear_column()
 
 
     def _game_over_screen(self) -> None:
-        # Displays a "GAME OVER" message
-        font = pygame.font.Font(None, 50)
+        # Displays a "GAME OVER" message over the board, sized to the window
+        window = self._surface.get_rect()
+        font = pygame.font.Font(None, max(1, round(50 * window.height / self._height)))
         text = font.render('GAME OVER', True, pygame.Color(255, 255, 255), _BACKGROUND_COLOR)
         textRect = text.get_rect()
-        textRect.center = (_WIDTH / 2, _HEIGHT / 2)
-        self._drawing_surface.blit(text, textRect)
-        self._surface.blit(pygame.transform.scale(self._drawing_surface,
-                                                  self._surface.get_rect().size),
-                            (0, 0))
+        textRect.center = window.center
+        self._surface.blit(text, textRect)
         pygame.display.flip()
 
     def _add_faller_to_random_clear_column(self) -> None:
-        # First goes through the game and creates a list of columns that
-        # have the top tile empty
-        list_of_free_columns = []
-        for i in range(6):
-            if self._game.state()[0][i][0] == ' ':
-                list_of_free_columns.append(i + 1)
+        # First finds the columns that have the top tile empty, numbered
+        # from 1 like add_faller expects
+        list_of_free_columns = [col + 1 for col in self._game.free_columns()]
         # If no columns have the top tile empty, end the game
         if list_of_free_columns == []:
-            raise project4_game.GameOverError
+            raise columns_game.GameOverError
         # Create 3 random colors for the jewels of the faller, and create a
         # faller in the game
         else:
-            c1 = random.randint(0, 6)
-            c2 = random.randint(0, 6)
-            c3 = random.randint(0, 6)
-            ac = random.randint(list_of_free_columns[0],
-                                list_of_free_columns[-1])
-            self._game.add_faller(f'{ac} {c1} {c2} {c3}') 
+            c1 = self._random.randint(0, 6)
+            c2 = self._random.randint(0, 6)
+            c3 = self._random.randint(0, 6)
+            ac = self._random.randint(list_of_free_columns[0],
+                                      list_of_free_columns[-1])
+            self._game.add_faller(f'{ac} {c1} {c2} {c3}')
     
+    def _apply_input(self, command: str) -> None:
+        # carries out a command from the computer player
+        if command == '<':
+            self._game.move_faller_left()
+        elif command == '>':
+            self._game.move_faller_right()
+        elif command == 'R':
+            self._game.rotate_faller()
+
     def _handle_events(self) -> None:
         # Handles user's actions
         for event in pygame.event.get():
@@ -99,6 +222,8 @@ class ColumnsGame:
                 self._running = False
             elif event.type == pygame.VIDEORESIZE:
                 self._create_surface(event.size)
+                self._last_frame = None
+                self._cell_rects = None
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT:
                     self._game.move_faller_left()
@@ -106,51 +231,159 @@ class ColumnsGame:
                     self._game.move_faller_right()
                 elif event.key == pygame.K_SPACE:
                     self._game.rotate_faller()
+                elif event.key == pygame.K_z:
+                    self._game.undo()
 
     def _redraw(self) -> None:
-        self._drawing_surface.fill(_BACKGROUND_COLOR)
-        
+        if self._batch_draw:
+            self._redraw_batch()
+            return
+        if self._cell_rects is None:
+            self._layout_cells()
+        if self._dirty_rects:
+            self._redraw_changed_cells()
+            return
+        self._surface.fill(_BACKGROUND_COLOR)
+        # Every cell is a blit of its pre-rendered tile, placed at the
+        # window's scale, so the board never has to be scaled as a whole
         gamestate = self._game.state()
+        blits = []
         for row in range(len(gamestate)):
             for col in range(len(gamestate[row])):
-                x = _WIDTH / 6 * col
-                y = _HEIGHT / 13 * row
-                # Location of each cell will be 1/6th of the width and 1/13th
-                # of the height
-                rect = pygame.Rect(x, y, _BLOCK_SIZE, _BLOCK_SIZE)
-                # if the cell is empty, fill it with the grid color
-                if gamestate[row][col][0] == ' ':
-                    pygame.draw.rect(self._drawing_surface, _GRID_COLOR, rect)
-                else:
-                    # if the jewel has landed, slightly darken the colors
-                    if gamestate[row][col][1] == 'LANDED':
-                        c = get_color(gamestate[row][col][0])
-                        c.r -= 55
-                        c.g -= 55
-                        c.b -= 55
-                        pygame.draw.rect(self._drawing_surface,
-                                         c,
-                                         rect)
-                    # if the jewels has found a match, make all matching jewels
-                    # white before disappearing
-                    elif gamestate[row][col][1] == 'MATCH':
-                        pygame.draw.rect(self._drawing_surface,
-                                         pygame.Color(255, 255, 255),
-                                         rect)
-                    # otherwise display the falling/frozen jewel regularly
-                    else:
-                        pygame.draw.rect(self._drawing_surface,
-                                         get_color(gamestate[row][col][0]),
-                                         rect)
-                                    
-        # Fit the drawing screen onto the game window for scaling purposes
-        self._surface.blit(pygame.transform.scale(self._drawing_surface,
-                                                  self._surface.get_rect().size), (0, 0))
+                cell = gamestate[row][col]
+                blits.append((self._tile(cell[0], cell[1]), self._cell_rects[row][col]))
+        self._surface.blits(blits, False)
+        if self._metrics is not None:
+            self._draw_overlay()
+        pygame.display.flip()
+
+    def _redraw_changed_cells(self) -> None:
+        # Only pushes the cells that changed since the last frame to the
+        # display. If nothing changed, nothing is drawn.
+        frame = [[(cell[0], cell[1]) for cell in row] for row in self._game.state()]
+        if self._last_frame is None:
+            self._surface.fill(_BACKGROUND_COLOR)
+        rects = []
+        for row in range(len(frame)):
+            for col in range(len(frame[row])):
+                if self._last_frame is not None and self._last_frame[row][col] == frame[row][col]:
+                    continue
+                color, state = frame[row][col]
+                rect = self._cell_rects[row][col]
+                self._surface.blit(self._tile(color, state), rect)
+                rects.append(rect)
+        if self._metrics is not None:
+            rects.append(self._draw_overlay())
+        if self._last_frame is None:
+            pygame.display.flip()
+        elif rects != []:
+            pygame.display.update(rects)
+        self._last_frame = frame
+
+    def _redraw_batch(self) -> None:
+        # Looks up the pixel color of every cell at once, writes them into
+        # a surface with one pixel per cell, and scales that to the window
+        # in one call, instead of drawing each cell on its own
+        if self._board_surface is None:
+            self._board_surface = pygame.Surface((self._game.columns(), self._game.rows()))
+            self._palette = _palette()
+        colors, states = columns_array.board_arrays(self._game)
+        # surfarray arrays are indexed (x, y), so the board is transposed
+        pygame.surfarray.blit_array(self._board_surface, self._palette[colors.T, states.T])
+        pygame.transform.scale(self._board_surface, self._surface.get_size(), self._surface)
+        if self._metrics is not None:
+            self._draw_overlay()
         pygame.display.flip()
 
+    def _draw_overlay(self) -> 'pygame.Rect':
+        # Draws the metrics in the top left corner, re-rendering the text
+        # twice a second, and returns the area it covers
+        now = pygame.time.get_ticks()
+        if self._overlay is None or now - self._overlay_time >= 500:
+            font = pygame.font.Font(None, 18)
+            lines = [font.render(line, True, pygame.Color(255, 255, 255))
+                     for line in self._metrics.overlay_lines()]
+            width = max([line.get_width() for line in lines], default=1)
+            height = sum(line.get_height() for line in lines) or 1
+            self._overlay = pygame.Surface((width, height))
+            self._overlay.fill(_BACKGROUND_COLOR)
+            top = 0
+            for line in lines:
+                self._overlay.blit(line, (0, top))
+                top += line.get_height()
+            self._overlay_time = now
+        return self._surface.blit(self._overlay, (0, 0))
+
+    def _layout_cells(self) -> None:
+        # Works out where every cell goes at the current window size and
+        # drops the tiles rendered for the old size. Called for the first
+        # frame and after the window is resized.
+        width, height = self._surface.get_rect().size
+        scale_x = width / self._width
+        scale_y = height / self._height
+        rows = self._game.rows()
+        columns = self._game.columns()
+        # Location of each cell will be 1/columns of the width and 1/rows
+        # of the height
+        self._tile_size = (math.ceil(self._block_size * scale_x),
+                           math.ceil(self._block_size * scale_y))
+        self._cell_rects = []
+        for row in range(rows):
+            rects = []
+            for col in range(columns):
+                rects.append(pygame.Rect(math.floor(self._width / columns * col * scale_x),
+                                         math.floor(self._height / rows * row * scale_y),
+                                         *self._tile_size))
+            self._cell_rects.append(rects)
+        self._tiles = {}
+
+    def _tile(self, color: str, state: str) -> 'pygame.Surface':
+        # Returns the pre-rendered surface for a cell, rendering it the
+        # first time it is needed at this window size
+        key = (color, state, self._tile_size)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = pygame.Surface(self._tile_size)
+            tile.fill(_tile_color(color, state))
+            self._tiles[key] = tile
+        return tile
+
+
+
+def _palette() -> 'numpy.ndarray':
+    # The RGB color of a cell for every color byte and state code, as
+    # columns_array codes them; bytes that aren't jewels are black
+    palette = columns_array.np.zeros((256, 4, 3), dtype=columns_array.np.uint8)
+    states = ((columns_array.FROZEN, 'FROZEN'), (columns_array.FALL, 'FALL'),
+              (columns_array.LANDED, 'LANDED'), (columns_array.MATCH, 'MATCH'))
+    for color in ' 0123456':
+        for code, state in states:
+            palette[ord(color), code] = tuple(_tile_color(color, state))[:3]
+    return palette
+
+
+def _tile_color(color: str, state: str) -> 'pygame.Color':
+    # The color a cell is drawn with
+    if color == ' ':
+        # if the cell is empty, fill it with the grid color
+        return pygame.Color(_GRID_COLOR)
+    elif state == 'LANDED':
+        # if the jewel has landed, slightly darken the colors
+        c = get_color(color)
+        c.r -= 55
+        c.g -= 55
+        c.b -= 55
+        return c
+    elif state == 'MATCH':
+        # if the jewels has found a match, make all matching jewels
+        # white before disappearing
+        return pygame.Color(255, 255, 255)
+    else:
+        # otherwise display the falling/frozen jewel regularly
+        return get_color(color)
 
 
-def get_color(number: str) -> pygame.Color:
+def get_color(number: str) -> 'pygame.Color':
     # The color of the jewels are stored as numbers. This function turns the
     # numbers into a color for display in the game
     number = int(number)
@@ -0,0 +1,187 @@
+import collections
+import random
+import time
+import columns_game
+import columns_sim
+
+
+# A computer player. For each new faller it tries every column and
+# rotation on a clone of the game, drops the faller, lets the cascade play
+# out, and scores the board that is left. Scores are cached by the game's
+# fingerprint, so positions that come up again aren't simulated again.
+
+# score weights
+_CLEARED = 10
+_CHAIN = 30
+_MAX_HEIGHT = 3
+_BUMPINESS = 1
+_DANGER = 1000
+_LOSS = float('-inf')
+_MISSING = object()
+
+
+class AutoPlayer:
+    def __init__(self, time_budget: float = 0.005, cache_size: int = 65536):
+        # time_budget is the most time, in seconds, spent choosing where
+        # each faller goes; None searches every placement no matter how
+        # long it takes. cache_size is how many scored positions are kept.
+        self._time_budget = time_budget
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        # the faller the plan is for, the inputs left to give it, and the
+        # column the faller should be in before the next input
+        self._faller = None
+        self._plan = []
+        self._column = None
+        self._searches = 0
+        self._simulations = 0
+        self._hits = 0
+
+    def next_input(self, game: columns_game.Game) -> str:
+        # Returns the next command for the current faller: 'R', '<', '>',
+        # or '' when there's nothing to do but let it fall. A new plan is
+        # made for each new faller, and again if the faller didn't end up
+        # where the plan expected.
+        faller = game.faller()
+        if faller is None:
+            self._faller = None
+            return ''
+        if faller is not self._faller or faller.col != self._column:
+            self._faller = faller
+            self._plan = self._search(game)
+            self._column = faller.col
+        if self._plan == []:
+            return ''
+        command = self._plan.pop(0)
+        if command == '<':
+            self._column -= 1
+        elif command == '>':
+            self._column += 1
+        return command
+
+    def stats(self) -> dict:
+        return {'searches': self._searches,
+                'simulations': self._simulations,
+                'cache_hits': self._hits,
+                'cache_size': len(self._cache)}
+
+    def _search(self, game: columns_game.Game) -> list[str]:
+        # returns the inputs for the best placement found in the time
+        # budget, trying the columns nearest the faller first. The budget
+        # is checked before every simulation.
+        self._searches += 1
+        if self._time_budget is None:
+            deadline = None
+        else:
+            deadline = time.perf_counter() + self._time_budget
+        faller = game.faller()
+        position = (game.fingerprint(), faller.row, faller.col)
+        targets = sorted(range(game.columns()), key=lambda col: abs(col - faller.col))
+        # the heights without the faller, for every placement to start from
+        heights = game.column_heights()
+        best_score = None
+        best_plan = []
+        for target in targets:
+            colors = (faller.top, faller.mid, faller.bot)
+            for turns in range(3):
+                key = position + (colors, target)
+                score = self._cache.get(key, _MISSING)
+                if score is _MISSING:
+                    # only a cached score is free once the budget is used up
+                    if deadline is not None and time.perf_counter() > deadline:
+                        return best_plan
+                    score = self._simulate(game, heights, turns, target)
+                    self._store(key, score)
+                else:
+                    self._hits += 1
+                    self._cache.move_to_end(key)
+                if score is not None and (best_score is None or score > best_score):
+                    best_score = score
+                    side = '<' if target < faller.col else '>'
+                    best_plan = ['R'] * turns + [side] * abs(target - faller.col)
+                # the next rotation, as in Game.rotate_faller
+                colors = (colors[2], colors[0], colors[1])
+        return best_plan
+
+    def _simulate(self, game: columns_game.Game, heights: list[int], turns: int,
+                  target: int) -> float:
+        # Plays a placement on a clone and scores the result. heights are
+        # game's column heights. Returns None if the faller can't get to
+        # target.
+        self._simulations += 1
+        trial = game.clone()
+        for turn in range(turns):
+            trial.rotate_faller()
+        while trial.faller().col != target:
+            col = trial.faller().col
+            if target < col:
+                trial.move_faller_left()
+            else:
+                trial.move_faller_right()
+            if trial.faller().col == col:
+                return None
+        try:
+            # straight to where it lands rather than a move() per row
+            trial.drop_faller()
+            while trial.faller_exists():
+                trial.move()
+            # the jewels above a cleared one fall into its place, so each
+            # one cleared takes one off its column's height
+            heights = list(heights)
+            heights[target] += 3
+            depth = 0
+            for step in trial.cascade():
+                depth += 1
+                for row, col, color in step.matched:
+                    heights[col] -= 1
+        except columns_game.GameOverError:
+            return _LOSS
+        return _score(trial, heights, trial.jewels_cleared() - game.jewels_cleared(), depth)
+
+    def _store(self, key: tuple, score: float) -> None:
+        self._cache[key] = score
+        if len(self._cache) > self._cache_size:
+            # drop the least recently used position
+            self._cache.popitem(last=False)
+
+
+def _score(game: columns_game.Game, heights: list[int], cleared: int, depth: int) -> float:
+    highest = max(heights)
+    bumpiness = sum(abs(heights[i] - heights[i + 1]) for i in range(len(heights) - 1))
+    score = cleared * _CLEARED + max(depth - 1, 0) * _CHAIN
+    score -= highest * _MAX_HEIGHT + bumpiness * _BUMPINESS
+    if highest > game.rows() - 4:
+        score -= _DANGER
+    return score
+
+
+def play_auto(rows: int, columns: int, seed: int, max_ticks: int = 10000,
+              game_class: type = columns_game.Game,
+              player: AutoPlayer = None) -> columns_sim.SimResult:
+    # Plays a whole headless game with the computer choosing every input.
+    # Fallers come from seed like in columns_sim.play_random. With a time
+    # budget the moves chosen can depend on how fast the machine is; use
+    # AutoPlayer(time_budget=None) when runs have to repeat exactly.
+    if player is None:
+        player = AutoPlayer()
+    rng = random.Random(seed)
+    game = game_class(rows, columns, ['EMPTY'])
+    result = columns_sim.play(game, _auto_commands(game, rng, player, max_ticks))
+    result.stats()['seed'] = seed
+    result.stats().update(player.stats())
+    return result
+
+
+def _auto_commands(game: columns_game.Game, rng: random.Random,
+                   player: AutoPlayer, max_ticks: int):
+    for tick in range(max_ticks):
+        if not game.faller_exists() and not game.has_matches():
+            yield columns_sim.random_faller(game, rng)
+        # give all of the faller's inputs before it drops any further,
+        # allowing for a rotation and a move to every column
+        for i in range(game.columns() + 3):
+            command = player.next_input(game)
+            if command == '':
+                break
+            yield command
+        yield ''
@@ -0,0 +1,318 @@
+import numpy as np
+import columns_game
+
+
+# Colors are stored as the byte value of their character, so the empty
+# tile is the byte value of a space. States are stored as small integers
+# that index into _STATE_NAMES, numbered the same way as in the keys for
+# Game.fingerprint.
+EMPTY = ord(' ')
+FROZEN = 0
+FALL = 1
+LANDED = 2
+MATCH = 3
+_STATE_NAMES = ('FROZEN', 'FALL', 'LANDED', 'MATCH')
+_STATE_CODES = {name: code for code, name in enumerate(_STATE_NAMES)}
+
+
+def find_matches(colors: np.ndarray) -> np.ndarray:
+    # Returns a boolean array marking every jewel that is part of three in
+    # a row horizontally, vertically, or diagonally. Like
+    # Game._check_for_matches, each run is found by comparing a non-empty
+    # center with its two neighbors, so runs longer than three are covered
+    # by the overlapping centers. Each comparison is done for the whole
+    # board at once by lining up shifted slices of the color array.
+    matched = np.zeros(colors.shape, dtype=bool)
+    filled = colors != EMPTY
+    # horizontal: centers in columns 1 to n - 2
+    center = colors[:, 1:-1]
+    found = filled[:, 1:-1] & (center == colors[:, :-2]) & (center == colors[:, 2:])
+    matched[:, 1:-1] |= found
+    matched[:, :-2] |= found
+    matched[:, 2:] |= found
+    # vertical: centers in rows 1 to n - 2
+    center = colors[1:-1, :]
+    found = filled[1:-1, :] & (center == colors[:-2, :]) & (center == colors[2:, :])
+    matched[1:-1, :] |= found
+    matched[:-2, :] |= found
+    matched[2:, :] |= found
+    # diagonals: top left to bottom right, then top right to bottom left
+    center = colors[1:-1, 1:-1]
+    center_filled = filled[1:-1, 1:-1]
+    found = center_filled & (center == colors[:-2, :-2]) & (center == colors[2:, 2:])
+    matched[1:-1, 1:-1] |= found
+    matched[:-2, :-2] |= found
+    matched[2:, 2:] |= found
+    found = center_filled & (center == colors[:-2, 2:]) & (center == colors[2:, :-2])
+    matched[1:-1, 1:-1] |= found
+    matched[:-2, 2:] |= found
+    matched[2:, :-2] |= found
+    return matched
+
+
+def zobrist_keys(rows: np.ndarray, cols: np.ndarray, colors: np.ndarray,
+                 states) -> np.ndarray:
+    # columns_game.zobrist_key for many jewels at once. colors must all be
+    # jewels, not empty tiles. states can be an array or a single state.
+    x = ((rows.astype(np.uint64) << np.uint64(40))
+         ^ (cols.astype(np.uint64) << np.uint64(20))
+         ^ (colors.astype(np.uint64) << np.uint64(4))
+         ^ np.asarray(states).astype(np.uint64))
+    # same steps as columns_game.zobrist_mix; uint64 math wraps around,
+    # which takes the place of masking to 64 bits
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _xor_keys(rows: np.ndarray, cols: np.ndarray, colors: np.ndarray, states) -> int:
+    return int(np.bitwise_xor.reduce(zobrist_keys(rows, cols, colors, states)))
+
+
+def _zobrist_key(row: int, col: int, color: int, state: int) -> int:
+    # columns_game.zobrist_key for a color byte and state number
+    if color == EMPTY:
+        return 0
+    return columns_game.zobrist_mix((row << 40) ^ (col << 20) ^ (color << 4) ^ state)
+
+
+class ArrayGame(columns_game.Game):
+    # A Game that keeps the board in two integer coded NumPy arrays
+    # (one for colors and one for states) instead of a list of
+    # [color, state] lists. The faller logic is inherited from Game and
+    # goes through the cell access methods overridden below.
+
+    def _init_fields(self, rows: int, columns: int, full_scan_check: bool,
+                     undo_limit: int) -> None:
+        super()._init_fields(rows, columns, full_scan_check, undo_limit)
+        # the cells changed since the last match check are kept as a
+        # bounding box [top, bottom, left, right] rather than a set, so
+        # the check can run on one slice of the board
+        self._dirty_box = None
+        # true while the arrays are shared with a clone or snapshot
+        self._arrays_shared = False
+
+    def _fill_empty(self) -> None:
+        self._colors = np.full((self._rows, self._columns), EMPTY, dtype=np.uint8)
+        self._states = np.zeros((self._rows, self._columns), dtype=np.uint8)
+
+    def _fill_contents(self, start: list[str]) -> None:
+        self._fill_empty()
+        for i in range(self._rows):
+            # encode each row string once instead of splitting it into
+            # characters
+            row = start[i][:self._columns].encode('latin-1')
+            self._colors[i] = np.frombuffer(row, dtype=np.uint8)
+
+    def _fill_buffer(self, buffer, stride: int) -> None:
+        # views the rows in place, skipping the line endings, and copies
+        # them into the color array in one go
+        rows = np.ndarray((self._rows, self._columns), dtype=np.uint8,
+                          buffer=buffer, strides=(stride, 1))
+        self._colors = rows.copy()
+        self._states = np.zeros((self._rows, self._columns), dtype=np.uint8)
+
+    def _dump_colors(self) -> bytes:
+        newlines = np.full((self._rows, 1), ord('\n'), dtype=np.uint8)
+        return np.hstack((self._colors, newlines)).tobytes()
+
+    def _shift_all_down(self) -> list[int]:
+        # shifts all of the jewels to the bottom, keeping their order, for
+        # every column at once. Returns the columns that changed.
+        filled = self._colors != EMPTY
+        # a column only needs to settle if a jewel has a space below it
+        gaps = np.flatnonzero((filled[:-1] & ~filled[1:]).any(axis=0))
+        if len(gaps) == 0:
+            return []
+        # a stable sort on filled moves the empty cells to the top of
+        # each column without changing the order of the jewels
+        order = np.argsort(filled[:, gaps], axis=0, kind='stable')
+        colors = self._colors[:, gaps]
+        states = self._states[:, gaps]
+        shifted = np.take_along_axis(colors, order, axis=0)
+        shifted_states = np.take_along_axis(states, order, axis=0)
+        changed = np.flatnonzero((shifted != colors).any(axis=1))
+        # take the moved columns out of the fingerprint as they were and
+        # put them back in as they are now
+        rows, cols = np.nonzero(colors != EMPTY)
+        self._hash ^= _xor_keys(rows, gaps[cols], colors[rows, cols], states[rows, cols])
+        rows, cols = np.nonzero(shifted != EMPTY)
+        self._hash ^= _xor_keys(rows, gaps[cols], shifted[rows, cols], shifted_states[rows, cols])
+        self._own_arrays()
+        self._colors[:, gaps] = shifted
+        self._states[:, gaps] = shifted_states
+        self._mark_dirty_box(changed[0], changed[-1], gaps[0], gaps[-1])
+        return gaps.tolist()
+
+    def _check_for_matches(self) -> bool:
+        # same rules as Game._check_for_matches, but for the whole board
+        # at once. Returns true if there are any matches, false otherwise.
+        self._dirty_box = None
+        matched = find_matches(self._colors)
+        self._mark_matches(matched, 0, 0)
+        return bool(matched.any())
+
+    def _check_dirty_cells(self) -> bool:
+        # runs find_matches on the dirty box plus a two tile border, which
+        # holds every three in a row that includes a changed cell
+        if self._dirty_box is None:
+            return False
+        top, bottom, left, right = self._dirty_box
+        self._dirty_box = None
+        rows = slice(max(top - 2, 0), bottom + 3)
+        cols = slice(max(left - 2, 0), right + 3)
+        matched = find_matches(self._colors[rows, cols])
+        self._mark_matches(matched, rows.start, cols.start)
+        return bool(matched.any())
+
+    def _mark_matches(self, matched: np.ndarray, top: int, left: int) -> None:
+        # sets the state of the cells in matched, which starts at row top
+        # and column left of the board, to MATCH
+        rows, cols = np.nonzero(matched)
+        rows += top
+        cols += left
+        states = self._states[rows, cols]
+        new = states != MATCH
+        rows = rows[new]
+        cols = cols[new]
+        colors = self._colors[rows, cols]
+        if len(rows) == 0:
+            return
+        self._hash ^= (_xor_keys(rows, cols, colors, states[new])
+                       ^ _xor_keys(rows, cols, colors, MATCH))
+        self._own_arrays()
+        self._states[rows, cols] = MATCH
+        self._match_count += len(rows)
+
+    def _mark_dirty(self, row: int, col: int) -> None:
+        self._mark_dirty_box(row, row, col, col)
+
+    def _mark_dirty_box(self, top: int, bottom: int, left: int, right: int) -> None:
+        top, bottom, left, right = int(top), int(bottom), int(left), int(right)
+        if self._dirty_box is None:
+            self._dirty_box = [top, bottom, left, right]
+        else:
+            box = self._dirty_box
+            box[0] = min(box[0], top)
+            box[1] = max(box[1], bottom)
+            box[2] = min(box[2], left)
+            box[3] = max(box[3], right)
+
+    def _clear_matches(self) -> list[tuple[int, int, str]]:
+        matched = self._states == MATCH
+        rows, cols = np.nonzero(matched)
+        colors = self._colors[rows, cols]
+        self._hash ^= _xor_keys(rows, cols, colors, MATCH)
+        if len(rows) != 0:
+            self._own_arrays()
+        self._colors[matched] = EMPTY
+        self._states[matched] = FROZEN
+        self._cleared += len(rows)
+        self._match_count = 0
+        return list(zip(rows.tolist(), cols.tolist(), colors.tobytes().decode('latin-1')))
+
+    def _cell_color(self, row: int, col: int) -> str:
+        return chr(self._colors[row, col])
+
+    def _is_empty(self, row: int, col: int) -> bool:
+        return self._colors[row, col] == EMPTY and self._states[row, col] == FROZEN
+
+    def _landing_row(self) -> int:
+        # finds the first tile below the faller that isn't empty with one
+        # look at the rest of its column
+        faller = self._faller
+        below = slice(faller.row + 1, None)
+        blocked = np.flatnonzero((self._colors[below, faller.col] != EMPTY)
+                                 | (self._states[below, faller.col] != FROZEN))
+        if len(blocked) == 0:
+            return self._rows - 1
+        return faller.row + int(blocked[0])
+
+    def _set_cell(self, row: int, col: int, color: str, state: str) -> None:
+        old_color = int(self._colors[row, col])
+        old_state = int(self._states[row, col])
+        color = ord(color)
+        state = _STATE_CODES[state]
+        self._hash ^= (_zobrist_key(row, col, old_color, old_state)
+                       ^ _zobrist_key(row, col, color, state))
+        self._own_arrays()
+        self._colors[row, col] = color
+        self._states[row, col] = state
+
+    def _set_color(self, row: int, col: int, color: str) -> None:
+        old_color = int(self._colors[row, col])
+        state = int(self._states[row, col])
+        color = ord(color)
+        self._hash ^= (_zobrist_key(row, col, old_color, state)
+                       ^ _zobrist_key(row, col, color, state))
+        self._own_arrays()
+        self._colors[row, col] = color
+
+    def _clear_cell(self, row: int, col: int) -> None:
+        self._hash ^= _zobrist_key(row, col, int(self._colors[row, col]),
+                                   int(self._states[row, col]))
+        self._own_arrays()
+        self._colors[row, col] = EMPTY
+        self._states[row, col] = FROZEN
+
+    def _compute_fingerprint(self) -> int:
+        rows, cols = np.nonzero(self._colors != EMPTY)
+        return _xor_keys(rows, cols, self._colors[rows, cols], self._states[rows, cols])
+
+    def _share_board(self, other: columns_game.Game) -> None:
+        # both games use the same arrays until one of them changes a cell,
+        # and that one copies them first (see _own_arrays), so a clone or
+        # snapshot that is only read never copies the board
+        other._colors = self._colors
+        other._states = self._states
+        self._arrays_shared = other._arrays_shared = True
+        if self._dirty_box is not None:
+            other._dirty_box = list(self._dirty_box)
+
+    def _own_arrays(self) -> None:
+        # gives this game its own copy of arrays it shares with a clone or
+        # snapshot, before it writes to them
+        if self._arrays_shared:
+            self._colors = self._colors.copy()
+            self._states = self._states.copy()
+            self._arrays_shared = False
+
+    def column_heights(self) -> list[int]:
+        filled = (self._colors != EMPTY) & (self._states != FALL) & (self._states != LANDED)
+        # argmax finds the first filled row; columns with none are empty
+        first = np.where(filled.any(axis=0), filled.argmax(axis=0), self._rows)
+        return (self._rows - first).tolist()
+
+    def free_columns(self) -> list[int]:
+        return np.flatnonzero(self._colors[0] == EMPTY).tolist()
+
+    def colors(self) -> np.ndarray:
+        # the color array itself, one byte per cell. It may be shared with
+        # a clone, so read it but don't write to it
+        return self._colors
+
+    def states(self) -> np.ndarray:
+        # the state array itself, indexes into the state names. Read only,
+        # like colors()
+        return self._states
+
+    def state(self) -> list[list['Jems']]:
+        # builds the same list of [color, state] lists that Game keeps, so
+        # existing callers can keep reading the board the same way. This
+        # is a copy; changing it doesn't change the game.
+        return [[[chr(color), _STATE_NAMES[state]] for color, state in zip(colors, states)]
+                for colors, states in zip(self._colors.tolist(), self._states.tolist())]
+
+
+def board_arrays(game: columns_game.Game) -> tuple[np.ndarray, np.ndarray]:
+    # The color and state arrays of any game's board, coded the same way
+    # as ArrayGame's. An ArrayGame's own arrays are returned as they are;
+    # for other games they are built from state().
+    if isinstance(game, ArrayGame):
+        return game.colors(), game.states()
+    cells = [cell for row in game.state() for cell in row]
+    colors = np.frombuffer(''.join([cell[0] for cell in cells]).encode('latin-1'), dtype=np.uint8)
+    states = np.array([_STATE_CODES[cell[1]] for cell in cells], dtype=np.uint8)
+    shape = (game.rows(), game.columns())
+    return colors.reshape(shape), states.reshape(shape)
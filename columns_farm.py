@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import time
+import columns_game
+import columns_sim
+
+
+# Spreads many independent headless games across processes. Each game is
+# played by columns_sim.play_random with its own seed, so a game's result
+# only depends on its seed and not on which worker played it or how many
+# workers there are.
+
+
+class GameFarm:
+    def __init__(self, rows: int = 13, columns: int = 6, max_ticks: int = 10000,
+                 processes: int = None, game_class: type = columns_game.Game,
+                 chunksize: int = 16):
+        # processes defaults to the number of cores
+        self._rows = rows
+        self._columns = columns
+        self._max_ticks = max_ticks
+        self._processes = processes or os.cpu_count() or 1
+        self._game_class = game_class
+        self._chunksize = chunksize
+        # per worker totals, keyed by the worker's process id
+        self._workers = {}
+
+    def run(self, seeds: list[int]):
+        # Yields a columns_sim.SimResult for every seed as soon as its game
+        # finishes, so the order depends on scheduling. Each result's stats
+        # include 'seed' and 'worker' (the process id that played it).
+        jobs = [(self._rows, self._columns, seed, self._max_ticks, self._game_class)
+                for seed in seeds]
+        with multiprocessing.Pool(self._processes) as pool:
+            for result in pool.imap_unordered(_play_seed, jobs, self._chunksize):
+                self._record(result.stats())
+                yield result
+
+    def run_all(self, seeds: list[int]) -> list[columns_sim.SimResult]:
+        # Plays every seed and returns the results in the same order as
+        # seeds
+        results = {}
+        for result in self.run(seeds):
+            results[result.stats()['seed']] = result
+        return [results[seed] for seed in seeds]
+
+    def worker_stats(self) -> dict[int, dict]:
+        # games, ticks and busy time for each worker so far, plus the
+        # throughput they work out to
+        stats = {}
+        for worker, totals in self._workers.items():
+            seconds = totals['seconds']
+            stats[worker] = dict(totals,
+                                 games_per_second=totals['games'] / seconds if seconds > 0 else 0.0,
+                                 ticks_per_second=totals['ticks'] / seconds if seconds > 0 else 0.0)
+        return stats
+
+    def _record(self, stats: dict) -> None:
+        totals = self._workers.setdefault(stats['worker'],
+                                          {'games': 0, 'ticks': 0, 'seconds': 0.0})
+        totals['games'] += 1
+        totals['ticks'] += stats['ticks']
+        totals['seconds'] += stats['worker_seconds']
+
+
+def _play_seed(job: tuple) -> columns_sim.SimResult:
+    # runs in the worker process
+    rows, columns, seed, max_ticks, game_class = job
+    begin = time.perf_counter()
+    result = columns_sim.play_random(rows, columns, seed, max_ticks, game_class)
+    stats = result.stats()
+    stats['worker'] = os.getpid()
+    stats['worker_seconds'] = time.perf_counter() - begin
+    return result
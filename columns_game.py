@@ -1,3 +1,11 @@
+import collections.abc
+import mmap
+
+
+_MASK64 = (1 << 64) - 1
+_STATE_NUMBERS = {'FROZEN': 0, 'FALL': 1, 'LANDED': 2, 'MATCH': 3}
+
+
 class GameOverError(Exception):
     # thrown when the game ends for the input/output program to know the
     # game ended and to display an error message
@@ -7,112 +15,189 @@ class GameOverError(Exception):
 
 
 class Game:
-    def __init__(self, rows: int, columns: int, start: list[str]):
+    def __init__(self, rows: int, columns: int, start: list[str],
+                 full_scan_check: bool = False, undo_limit: int = 0):
         # start is a list passed in that will have "EMPTY" or "CONTENTS"
         # as its first element. If "EMPTY", the list has no more elements,
         # but if "CONTENTS", it will include a new element for each row
         # of the game, specifying what the user wants to have the game
-        # board look like at the start.
+        # board look like at the start. If full_scan_check is True, every
+        # incremental match check is compared against a full board scan,
+        # which is slow but useful when debugging. If undo_limit is more
+        # than 0, the game keeps that many positions to go back to with
+        # undo().
+        self._init_fields(rows, columns, full_scan_check, undo_limit)
+        if start[0] == 'EMPTY':
+            # create an empty board
+            self._fill_empty()
+        elif start[0] == 'CONTENTS':
+            # the rows come after 'CONTENTS'; the caller's list is left
+            # as it is
+            self._fill_contents(start[1:])
+            self._settle()
+
+    def _init_fields(self, rows: int, columns: int, full_scan_check: bool,
+                     undo_limit: int) -> None:
+        # sets up everything but the board itself
         self._rows = rows
         self._columns = columns
         # state is the game board
         self._state = []
-        # jtop, jmid, and jbot represent the top, middle, and bottom jewels,
-        # respectively
-        self._jtop = None
-        self._jmid = None
-        self._jbot = None
-        # faller will become a list that holds the 3 jewels in order
+        # shared[row] is True while the row's list and its tiles may be
+        # shared with a clone or snapshot, in which case the row is copied
+        # before it is changed
+        self._shared = [False] * rows
+        # faller will become a Faller that holds the position and colors
+        # of the 3 jewels
         self._faller = None
         # faller state will indicate whether its falling, landed, or frozen
         self._faller_state = None
-        if start[0] == 'EMPTY':
-            # create an empty list of lists
-            for i in range(self._rows):
-                row = []
-                for j in range(self._columns):
-                    row.append(self._empty())
-                self._state.append(row)
-        elif start[0] == 'CONTENTS':
-            # deletes the user command  from the list after its been
-            # processed to reduce confusion
-            del start[0]
-            for i in range(self._rows):
-                row = []
-                # turn every character, including spaces, from the user
-                # commands into a list of those characters.
-                initial = [*start[i]]
-                for j in range(self._columns):
-                    # each element in the game is represented by a list,
-                    # in the format [jewel/empty, state]. In this case,
-                    # all the initial elements are frozen and added to
-                    # the game board
-                    row.append([initial[j], 'FROZEN'])
-                self._state.append(row)
-            # processes the spaces between jewels and shifts them all down
-            self._shift_all_down()
-            # check if there are any jewels matching
-            self._check_for_matches()
-
-    def _shift_all_down(self) -> None:
+        # dirty holds the cells that changed since the last match check,
+        # so only their neighborhoods have to be checked again
+        self._dirty = set()
+        # number of jewels marked MATCH and waiting to be cleared
+        self._match_count = 0
+        self._full_scan_check = full_scan_check
+        # total number of jewels cleared by matches so far
+        self._cleared = 0
+        # Zobrist hash of the board, kept up to date by every change to a
+        # tile; see fingerprint()
+        self._hash = 0
+        # earlier positions for undo(), newest last
+        if undo_limit > 0:
+            self._undo = collections.deque(maxlen=undo_limit)
+        else:
+            self._undo = None
+
+    def _settle(self) -> None:
+        # called once a board has been filled from contents
+        self._hash = self._compute_fingerprint()
+        # processes the spaces between jewels and shifts them all down
+        self._shift_all_down()
+        # check if there are any jewels matching
+        self._check_for_matches()
+
+    def _fill_empty(self) -> None:
+        # create an empty list of lists
+        for i in range(self._rows):
+            row = []
+            for j in range(self._columns):
+                row.append(self._empty())
+            self._state.append(row)
+
+    def _fill_contents(self, start: list[str]) -> None:
+        for i in range(self._rows):
+            row = []
+            # turn every character, including spaces, from the user
+            # commands into a list of those characters.
+            initial = [*start[i]]
+            for j in range(self._columns):
+                # each element in the game is represented by a list,
+                # in the format [jewel/empty, state]. In this case,
+                # all the initial elements are frozen and added to
+                # the game board
+                row.append([initial[j], 'FROZEN'])
+            self._state.append(row)
+
+    def _fill_buffer(self, buffer, stride: int) -> None:
+        # fills the board from the rows of a buffer that start every
+        # stride bytes (see load_board). Each row is decoded as a whole,
+        # and its tiles are made in one comprehension.
+        text = bytes(buffer).decode('latin-1')
+        for i in range(0, self._rows * stride, stride):
+            self._state.append([[color, 'FROZEN'] for color in text[i:i + self._columns]])
+
+    def _dump_colors(self) -> bytes:
+        # the color of every tile, one line per row (see dump_board)
+        return ''.join([''.join([cell[0] for cell in row]) + '\n'
+                        for row in self._state]).encode('latin-1')
+
+    def _shift_all_down(self) -> list[int]:
         # shifts all of the jewels to the bottom, going through any spaces
-        # in between
-        while True:
-            check = 0
-            for i in range(self._rows):
-                for j in range(self._columns):
-                    try:
-                        if self._state[i][j][0] != ' ' and self._state[i + 1][j][0] == ' ':
-                            piece = self._state[i][j]
-                            self._state[i + 1][j] = piece
-                            self._state[i][j] = self._empty()
-                            check += 1
-                    except IndexError:
-                        pass
-            if check == 0:
-                break
+        # in between. Each column is settled in a single pass from the
+        # bottom up. Returns the columns that changed.
+        shifted = []
+        for j in range(self._columns):
+            # bottom is the lowest row in the column that hasn't been
+            # filled yet
+            bottom = self._rows - 1
+            moved = False
+            for i in range(self._rows - 1, -1, -1):
+                if self._state[i][j][0] != ' ':
+                    if i != bottom:
+                        if self._shared[i]:
+                            self._own_row(i)
+                        if self._shared[bottom]:
+                            self._own_row(bottom)
+                        # swap the jewel with the empty tile below it
+                        # rather than making a new empty tile
+                        piece = self._state[i][j]
+                        self._state[i][j] = self._state[bottom][j]
+                        self._state[bottom][j] = piece
+                        self._hash ^= (zobrist_key(i, j, piece[0], piece[1])
+                                       ^ zobrist_key(bottom, j, piece[0], piece[1]))
+                        self._mark_dirty(bottom, j)
+                        moved = True
+                    bottom -= 1
+            if moved:
+                shifted.append(j)
+        return shifted
 
 
 
     def add_faller(self, faller: str) -> None:
-        # creates a list of three jewels, representing a faller
+        # creates a faller of three jewels just above the board
         if self._faller != None:
             pass
         else:
+            self._save_undo()
             jewel = faller.split(' ')
-            self._jtop = Jewel(jewel[1], -3, int(jewel[0]) - 1)
-            self._jmid = Jewel(jewel[2], -2, int(jewel[0]) - 1)
-            self._jbot = Jewel(jewel[3], -1, int(jewel[0]) - 1)
-            self._faller = [self._jbot, self._jmid, self._jtop]
+            self._faller = Faller(int(jewel[0]) - 1, -1, jewel[1], jewel[2], jewel[3])
             # first check if the top spot in the column specified
             # by the user is clear
             if self._check_below_clear():
                 # if it is clear, move the faller down, showing the
                 # bottomost jewel in the first row
-                for jewel in self._faller:
-                    jewel.down()
+                self._faller.row += 1
                 # if the row below the new location of the faller is 
                 # also open, the state of the faller becomes "FALL",
                 # otherwise, it becomes "landed"
                 if self._check_below_clear():
                     self._faller_state = 'FALL'
-                    for jewel in self._faller:
-                        if jewel.row() >= 0:
-                            self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state]
                 else:
                     self._faller_state = 'LANDED'
-                    for jewel in self._faller:
-                        if jewel.row() >= 0:
-                            self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state]                
+                self._draw_faller()
             # if the top spot in the column specified by the user is
             # occupied, the game ends
             else:
                 raise GameOverError
 
     def clear(self) -> None:
-        while self._check_for_matches():
-            self._clear_matches()
-            self._shift_all_down()
+        # plays the whole cascade
+        for step in self.cascade():
+            pass
+
+    def cascade(self) -> collections.abc.Iterator['CascadeStep']:
+        # Clears matches one step at a time. Each step removes the matched
+        # jewels, shifts the jewels above them down, and marks the matches
+        # that makes, then yields a CascadeStep saying what it did. The
+        # generator stops when there are no more matches, so a caller can
+        # animate or score a cascade a step at a time, or stop part way.
+        # Matches are marked as they're made, so only the jewels that
+        # shifted can make new ones.
+        matches = self.has_matches()
+        while matches:
+            matched = self._clear_matches()
+            shifted = self._shift_all_down()
+            matches = self._check_dirty_for_matches()
+            yield CascadeStep(matched, shifted)
+
+    def has_matches(self) -> bool:
+        # true if there are matched jewels waiting to be cleared. Every
+        # match is marked when the move that made it is checked, so this
+        # only checks the cells changed since then, not the whole board.
+        self._check_dirty_for_matches()
+        return self._match_count > 0
 
     def faller_exists(self) -> bool:
         if self._faller == None:
@@ -125,6 +210,7 @@ class Game:
         # jewels to "MATCH" if they match either vertically, horizontally,
         # or diagonally. Returns true if there are any matches, false
         # otherwise.
+        self._dirty.clear()
         matches = False
         for row in range(self._rows):
             for col in range(1, self._columns - 1):
@@ -135,9 +221,9 @@ class Game:
                     left = self._state[row][col - 1][0]
                     right = self._state[row][col + 1][0]
                     if center == left and center == right:
-                        self._state[row][col][1] = 'MATCH'
-                        self._state[row][col - 1][1] = 'MATCH'
-                        self._state[row][col + 1][1] = 'MATCH'
+                        self._mark_match(row, col)
+                        self._mark_match(row, col - 1)
+                        self._mark_match(row, col + 1)
                         matches = True          
         for row in range(1, self._rows - 1):
             for col in range(self._columns):
@@ -147,9 +233,9 @@ class Game:
                     above = self._state[row - 1][col][0]
                     below = self._state[row + 1][col][0]
                     if center == above and center == below:
-                        self._state[row][col][1] = 'MATCH'
-                        self._state[row - 1][col][1] = 'MATCH'
-                        self._state[row + 1][col][1] = 'MATCH'
+                        self._mark_match(row, col)
+                        self._mark_match(row - 1, col)
+                        self._mark_match(row + 1, col)
                         matches = True  
         for row in range(1, self._rows - 1):
             for col in range(1, self._columns - 1):
@@ -161,32 +247,130 @@ class Game:
                     bot_left = self._state[row + 1][col - 1][0]
                     bot_right = self._state[row + 1][col + 1][0]
                     if center == top_left and center == bot_right:
-                        self._state[row][col][1] = 'MATCH'
-                        self._state[row - 1][col - 1][1] = 'MATCH'
-                        self._state[row + 1][col + 1][1] = 'MATCH'
+                        self._mark_match(row, col)
+                        self._mark_match(row - 1, col - 1)
+                        self._mark_match(row + 1, col + 1)
                         matches = True
                     if center == top_right and center == bot_left:
-                        self._state[row][col][1] = 'MATCH'
-                        self._state[row - 1][col + 1][1] = 'MATCH'
-                        self._state[row + 1][col - 1][1] = 'MATCH'
+                        self._mark_match(row, col)
+                        self._mark_match(row - 1, col + 1)
+                        self._mark_match(row + 1, col - 1)
                         matches = True      
         return matches
 
-        
+    def _check_dirty_for_matches(self) -> bool:
+        # checks for matches only around the cells that changed since the
+        # last check. Any match that doesn't include a changed cell was
+        # already there at the last check, so it has already been marked.
+        matches = self._check_dirty_cells()
+        if self._full_scan_check:
+            self._compare_with_full_scan()
+        return matches
+
+    def _check_dirty_cells(self) -> bool:
+        # every three in a row that includes a changed cell has its center
+        # within one tile of that cell
+        centers = set()
+        for row, col in self._dirty:
+            for r in range(max(row - 1, 0), min(row + 2, self._rows)):
+                for c in range(max(col - 1, 0), min(col + 2, self._columns)):
+                    centers.add((r, c))
+        self._dirty.clear()
+        matches = False
+        for row, col in centers:
+            if self._match_at(row, col):
+                matches = True
+        return matches
 
-    def _clear_matches(self) -> None:
+    def _match_at(self, row: int, col: int) -> bool:
+        # same rules as _check_for_matches, for a single center tile
+        center = self._state[row][col][0]
+        if center == ' ':
+            return False
+        matches = False
+        inside_row = 0 < row < self._rows - 1
+        inside_col = 0 < col < self._columns - 1
+        if inside_col:
+            if center == self._state[row][col - 1][0] and center == self._state[row][col + 1][0]:
+                self._mark_match(row, col)
+                self._mark_match(row, col - 1)
+                self._mark_match(row, col + 1)
+                matches = True
+        if inside_row:
+            if center == self._state[row - 1][col][0] and center == self._state[row + 1][col][0]:
+                self._mark_match(row, col)
+                self._mark_match(row - 1, col)
+                self._mark_match(row + 1, col)
+                matches = True
+        if inside_row and inside_col:
+            if center == self._state[row - 1][col - 1][0] and center == self._state[row + 1][col + 1][0]:
+                self._mark_match(row, col)
+                self._mark_match(row - 1, col - 1)
+                self._mark_match(row + 1, col + 1)
+                matches = True
+            if center == self._state[row - 1][col + 1][0] and center == self._state[row + 1][col - 1][0]:
+                self._mark_match(row, col)
+                self._mark_match(row - 1, col + 1)
+                self._mark_match(row + 1, col - 1)
+                matches = True
+        return matches
+
+    def _compare_with_full_scan(self) -> None:
+        # runs a full board scan after an incremental check and fails if
+        # the full scan marks anything the incremental check missed, or
+        # if the fingerprint no longer matches the board
+        before = self._matched_cells()
+        self._check_for_matches()
+        missed = self._matched_cells() - before
+        if missed:
+            raise AssertionError(f'incremental match check missed {sorted(missed)}')
+        if self._hash != self._compute_fingerprint():
+            raise AssertionError('fingerprint is out of date with the board')
+
+    def _matched_cells(self) -> set[tuple[int, int]]:
+        return {(row, col)
+                for row, cells in enumerate(self.state())
+                for col, cell in enumerate(cells)
+                if cell[1] == 'MATCH'}
+
+    def _mark_dirty(self, row: int, col: int) -> None:
+        self._dirty.add((row, col))
+
+    def _mark_match(self, row: int, col: int) -> None:
+        if self._shared[row]:
+            self._own_row(row)
+        cell = self._state[row][col]
+        if cell[1] != 'MATCH':
+            self._hash ^= (zobrist_key(row, col, cell[0], cell[1])
+                           ^ zobrist_key(row, col, cell[0], 'MATCH'))
+            cell[1] = 'MATCH'
+            self._match_count += 1
+
+    def _clear_matches(self) -> list[tuple[int, int, str]]:
         # looks for any jewels that have been marked as having been
-        # matched, and removes them from the game board
+        # matched, and removes them from the game board. Returns the
+        # (row, col, color) of each jewel removed.
+        cleared = []
         for row in range(self._rows):
             for col in range(self._columns):
-                if self._state[row][col][1] == 'MATCH':
-                    self._state[row][col] = self._empty()
+                cell = self._state[row][col]
+                if cell[1] == 'MATCH':
+                    if self._shared[row]:
+                        self._own_row(row)
+                        cell = self._state[row][col]
+                    self._hash ^= zobrist_key(row, col, cell[0], 'MATCH')
+                    cleared.append((row, col, cell[0]))
+                    cell[0] = ' '
+                    cell[1] = 'FROZEN'
+        self._cleared += len(cleared)
+        self._match_count = 0
+        return cleared
 
     def _check_below_clear(self) -> bool:
         # Returns true if the tile below the faller is empty, false otherwise.
         if self._faller != None:
-            if self._rows - 1 > self._jbot.row():
-                if self._state[self._jbot.row() + 1][self._jbot.col()] == [' ', 'FROZEN']:
+            if self._rows - 1 > self._faller.row:
+                if self._is_empty(self._faller.row + 1, self._faller.col):
                     return True
                 else:
                     return False
@@ -199,43 +383,57 @@ class Game:
         # processes a blank input by the user.
         # if there are no fallers, and there are matches, clear the
         # matches and shift all jewels down and marks any new matches
+        self._save_undo()
         if self._faller == None:
-            if self._check_for_matches():
-                self._clear_matches()
-                self._shift_all_down()
-                self._check_for_matches()
+            next(self.cascade(), None)
         else:
             # if the faller is in fall state, move the faller down and
             # adjust the state/other tiles accordingly
             if self._faller_state == 'FALL':
-                for jewel in self._faller:
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = self._empty()
-                    jewel.down()
-                    if not self._check_below_clear():
-                        self._faller_state = 'LANDED'
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state] 
+                self._erase_faller()
+                self._faller.row += 1
+                if not self._check_below_clear():
+                    self._faller_state = 'LANDED'
+                self._draw_faller()
             # if faller is in landed state, freeze it. Check if any part of
             # faller did not make it onto the board, and if so, end the game.
             elif self._faller_state == 'LANDED':
                 self._faller_state = 'FROZEN'
-                for jewel in self._faller:
-                    if jewel.row() < 0:
+                faller = self._faller
+                for row in range(faller.row, faller.row - 3, -1):
+                    if row < 0:
                         raise GameOverError
                     else:
-                        self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state]                   
+                        self._set_cell(row, faller.col, faller.color_at(row), self._faller_state)
+                        self._mark_dirty(row, faller.col)
                 # after faller freezes, if the game is still going,
                 # check if any matches have been resulted from the faller,
                 # then reset the faller variables
-                self._check_for_matches()
-                self._jtop = None
-                self._jmid = None
-                self._jbot = None
+                self._check_dirty_for_matches()
                 self._faller = None
                 self._faller_state = None
 
-
+    def drop_faller(self) -> None:
+        # moves a falling faller straight down to where it lands, the same
+        # as calling move() until it has landed, but in one step. The next
+        # move() freezes it.
+        if self._faller == None or self._faller_state != 'FALL':
+            pass
+        else:
+            self._save_undo()
+            self._erase_faller()
+            self._faller.row = self._landing_row()
+            self._faller_state = 'LANDED'
+            self._draw_faller()
+
+    def _landing_row(self) -> int:
+        # the row the faller's bottom jewel lands on: the last empty tile
+        # before the first one that isn't, going down its column
+        faller = self._faller
+        row = faller.row
+        while row + 1 < self._rows and self._is_empty(row + 1, faller.col):
+            row += 1
+        return row
 
     def move_faller_left(self) -> None:
         # moves visible parts of the faller one tile to the left if
@@ -244,20 +442,12 @@ class Game:
             pass
         else:
             if self._check_left_is_clear():
-                for jewel in self._faller:
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = self._empty()
-                    jewel.left()
-                    if self._check_below_clear():
-                        self._faller_state = 'FALL'
-                    else:
-                        self._faller_state = 'LANDED'
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state]            
+                self._save_undo()
+                self._move_faller_sideways(-1)
     def _check_left_is_clear(self) -> bool:
         # verifies the left of the faller is empty
-        if self._jbot.col() > 0:
-            if self._state[self._jbot.row()][self._jbot.col() - 1][0] == ' ':
+        if self._faller.col > 0:
+            if self._cell_color(self._faller.row, self._faller.col - 1) == ' ':
                 return True
         return False
 
@@ -270,40 +460,205 @@ class Game:
             pass
         else:
             if self._check_right_is_clear():
-                for jewel in self._faller:
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = self._empty()
-                    jewel.right()
-                    if self._check_below_clear():
-                        self._faller_state = 'FALL'
-                    else:
-                        self._faller_state = 'LANDED'
-                    if jewel.row() >= 0:
-                        self._state[jewel.row()][jewel.col()] = [jewel.color(), self._faller_state]  
+                self._save_undo()
+                self._move_faller_sideways(1)
     def _check_right_is_clear(self) -> bool:
         # verifies the right of the faller is empty
-        if self._jbot.col() < self.columns() - 1:
-            if self._state[self._jbot.row()][self._jbot.col() + 1][0] == ' ':
+        if self._faller.col < self.columns() - 1:
+            if self._cell_color(self._faller.row, self._faller.col + 1) == ' ':
                 return True
         return False
+
+    def _move_faller_sideways(self, step: int) -> None:
+        self._erase_faller()
+        self._faller.col += step
+        if self._check_below_clear():
+            self._faller_state = 'FALL'
+        else:
+            self._faller_state = 'LANDED'
+        self._draw_faller()
+
+    def _draw_faller(self) -> None:
+        # writes the visible jewels of the faller onto the board, in the
+        # faller's current state
+        faller = self._faller
+        row = faller.row
+        if row >= 0:
+            self._set_cell(row, faller.col, faller.bot, self._faller_state)
+            if row >= 1:
+                self._set_cell(row - 1, faller.col, faller.mid, self._faller_state)
+                if row >= 2:
+                    self._set_cell(row - 2, faller.col, faller.top, self._faller_state)
+
+    def _erase_faller(self) -> None:
+        # empties the tiles under the visible jewels of the faller
+        faller = self._faller
+        for row in range(max(faller.row - 2, 0), faller.row + 1):
+            self._clear_cell(row, faller.col)
     
     def _empty(self) -> list[' ', 'FROZEN']:
         # Returns the representation of an empty tile
         return [' ', 'FROZEN']                
 
+    # Cell access used by the faller logic. Board backends that don't
+    # store the board as nested lists override these.
+    def _cell_color(self, row: int, col: int) -> str:
+        return self._state[row][col][0]
+
+    def _is_empty(self, row: int, col: int) -> bool:
+        cell = self._state[row][col]
+        return cell[0] == ' ' and cell[1] == 'FROZEN'
+
+    # Every tile has its own [color, state] list for the life of the game,
+    # and these change it in place instead of making a new one
+    def _set_cell(self, row: int, col: int, color: str, state: str) -> None:
+        if self._shared[row]:
+            self._own_row(row)
+        cell = self._state[row][col]
+        self._hash ^= (zobrist_key(row, col, cell[0], cell[1])
+                       ^ zobrist_key(row, col, color, state))
+        cell[0] = color
+        cell[1] = state
+
+    def _set_color(self, row: int, col: int, color: str) -> None:
+        if self._shared[row]:
+            self._own_row(row)
+        cell = self._state[row][col]
+        self._hash ^= (zobrist_key(row, col, cell[0], cell[1])
+                       ^ zobrist_key(row, col, color, cell[1]))
+        cell[0] = color
+
+    def _clear_cell(self, row: int, col: int) -> None:
+        if self._shared[row]:
+            self._own_row(row)
+        cell = self._state[row][col]
+        self._hash ^= zobrist_key(row, col, cell[0], cell[1])
+        cell[0] = ' '
+        cell[1] = 'FROZEN'
+
+    def _own_row(self, row: int) -> None:
+        # gives this game its own copy of a shared row, so changing it
+        # doesn't change the clones or snapshots that share it
+        self._state[row] = [cell[:] for cell in self._state[row]]
+        self._shared[row] = False
+
+    def clone(self) -> 'Game':
+        # Returns a new game in the same position as this one. The two
+        # share the board's rows until one of them changes a row, so a
+        # clone costs one pointer per row plus a copy of each row that is
+        # later changed, rather than a copy of the whole board. The clone
+        # has no undo history, and methods timed with columns_metrics stay
+        # with this game.
+        other = object.__new__(type(self))
+        self._copy_position(other)
+        other._undo = None
+        return other
+
+    def snapshot(self) -> 'Game':
+        # Returns a copy of the current position to give to restore()
+        # later. It is a clone, and shares rows the same way.
+        return self.clone()
+
+    def restore(self, snapshot: 'Game') -> None:
+        # Puts the game back in the position of snapshot. The snapshot
+        # can be restored again later.
+        snapshot._copy_position(self)
+
+    def undo(self) -> bool:
+        # Goes back to the position before the last add_faller, move,
+        # move_faller_left, move_faller_right, or rotate_faller. Returns
+        # false if there is nothing to undo.
+        if not self._undo:
+            return False
+        self.restore(self._undo.pop())
+        return True
+
+    def _save_undo(self) -> None:
+        if self._undo is not None:
+            self._undo.append(self.snapshot())
+
+    def _copy_position(self, other: 'Game') -> None:
+        # copies everything but the undo history and any instance methods
+        # into other, then shares the board with it
+        for name, value in self.__dict__.items():
+            if name != '_undo' and not callable(value):
+                setattr(other, name, value)
+        if self._faller != None:
+            other._faller = self._faller.copy()
+        other._dirty = set(self._dirty)
+        self._share_board(other)
+
+    def _share_board(self, other: 'Game') -> None:
+        other._state = list(self._state)
+        self._shared = [True] * self._rows
+        other._shared = [True] * self._rows
+
     def rotate_faller(self) -> None:
         # rotates the colors of the fallers as specified in the instructions
-        b_color = self._jbot.color()
-        m_color = self._jmid.color()
-        t_color = self._jtop.color()
-        self._jbot.set_color(m_color)
-        self._jmid.set_color(t_color)
-        self._jtop.set_color(b_color)
-        # update them on the board if they are visible
-        for jewel in self._faller:
-            if jewel.row() >= 0:
-                self._state[jewel.row()][jewel.col()][0] = jewel.color()
+        if self._faller == None:
+            pass
+        else:
+            self._save_undo()
+            faller = self._faller
+            faller.top, faller.mid, faller.bot = faller.bot, faller.top, faller.mid
+            # update them on the board if they are visible
+            for row in range(max(faller.row - 2, 0), faller.row + 1):
+                self._set_color(row, faller.col, faller.color_at(row))
                 
+    def faller(self) -> 'Faller':
+        # the current faller, or None if there isn't one
+        return self._faller
+
+    def column_heights(self) -> list[int]:
+        # how many rows each column is filled to, counting down from the
+        # first jewel in the column that isn't part of the faller
+        heights = [0] * self._columns
+        empty = [self._empty()] * self._columns
+        left = list(range(self._columns))
+        for row in range(self._rows):
+            cells = self._state[row]
+            # the empty rows above the jewels are skipped by comparing
+            # each one as a whole, rather than a tile at a time
+            if cells == empty:
+                continue
+            found = [col for col in left if cells[col][0] != ' '
+                     and cells[col][1] != 'FALL' and cells[col][1] != 'LANDED']
+            if found != []:
+                for col in found:
+                    heights[col] = self._rows - row
+                left = [col for col in left if heights[col] == 0]
+                if left == []:
+                    break
+        return heights
+
+    def free_columns(self) -> list[int]:
+        # the columns, from 0, whose top tile is empty, so a new faller
+        # can go in them
+        return [col for col, cell in enumerate(self._state[0]) if cell[0] == ' ']
+
+    def fingerprint(self) -> int:
+        # A 64 bit Zobrist hash of every jewel on the board and its state.
+        # It's updated with each change to the board, so reading it takes
+        # no time, and two games with the same board have the same
+        # fingerprint. Empty tiles count for nothing, so an empty board's
+        # fingerprint is 0.
+        return self._hash
+
+    def _compute_fingerprint(self) -> int:
+        # works out the fingerprint from scratch; the same as zobrist_key
+        # for every tile, but skipping empty tiles up front
+        h = 0
+        for row, cells in enumerate(self._state):
+            top = row << 40
+            for col, cell in enumerate(cells):
+                if cell[0] != ' ':
+                    h ^= zobrist_mix(top ^ (col << 20) ^ (ord(cell[0]) << 4)
+                                     ^ _STATE_NUMBERS[cell[1]])
+        return h
+
+    def jewels_cleared(self) -> int:
+        return self._cleared
+
     def rows(self) -> int:
         return self._rows
     def columns(self) -> int:
@@ -313,44 +668,120 @@ class Game:
         
 
 
-class Jewel:
-    # Jewel objects contain their color and the row/column they exist in
-    def __init__(self, color: str, row: int, col: int):
-        self._color = color
-        self._row = row
-        self._col = col
-
-    def down(self) -> None:
-        self._row += 1
-
-    def right(self) -> None:
-        self._col += 1
-
-    def left(self) -> None:
-        self._col -= 1
-
-    def set_row_col(self, row: int, col: int) -> None:
-        self._row = row
-        self._col = col
-
-    def set_color(self, color: str) -> None:
-        self._color = color
-        
-    def color(self) -> str:
-        return self._color
-
-    def row(self) -> int | None:
-        return self._row
-
-    def col(self) -> int | None:
-        return self._col
-
-
-
-
-
-
-
-
-
-
+def load_board(source, game_class: type = Game, settle: bool = True,
+               full_scan_check: bool = False, undo_limit: int = 0) -> Game:
+    # Makes a game from a board dump: one line per row, each line the
+    # color of every tile like the rows after 'CONTENTS', with '\n' or
+    # '\r\n' line endings. The size of the board comes from the dump.
+    # source is a path, which is memory-mapped, an open binary file, or
+    # a buffer such as bytes or an mmap. Every jewel starts out frozen.
+    # With settle, the jewels are shifted down and matches marked the same
+    # as with 'CONTENTS'; without it, the board is taken as it is, which
+    # saves the full scans for boards that are known to be settled, with
+    # no gaps and no matches.
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return load_board(buffer, game_class, settle, full_scan_check, undo_limit)
+    if hasattr(source, 'read'):
+        source = source.read()
+    columns = source.find(b'\n')
+    if columns == -1:
+        columns = len(source)
+    stride = columns + 1
+    if columns > 0 and source[columns - 1] == ord('\r'):
+        columns -= 1
+    # every row is columns tiles then the line ending, which only the
+    # last row may leave out
+    ending = stride - columns
+    if source[-1:] == b'\n':
+        rows, extra = divmod(len(source), stride)
+    else:
+        rows, extra = divmod(len(source) + ending, stride)
+    whole = source if isinstance(source, (bytes, bytearray)) else source[:]
+    if (columns == 0 or extra != 0
+            or source[columns::stride] != b'\r\n'[2 - ending:3 - ending] * len(source[columns::stride])
+            or source[stride - 1::stride] != b'\n' * len(source[stride - 1::stride])
+            or whole.count(b'\n') not in (rows - 1, rows)):
+        raise ValueError('board dump rows must all be the same length')
+    game = object.__new__(game_class)
+    game._init_fields(rows, columns, full_scan_check, undo_limit)
+    game._fill_buffer(source, stride)
+    if settle:
+        game._settle()
+    else:
+        game._hash = game._compute_fingerprint()
+    return game
+
+
+def dump_board(game: Game, file=None) -> bytes:
+    # Returns the colors on game's board in the format load_board reads,
+    # or writes them to file, a path or an open binary file. States aren't
+    # kept: a faller is dumped as the jewels it covers, and everything
+    # loads as frozen.
+    data = game._dump_colors()
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            f.write(data)
+    elif file is not None:
+        file.write(data)
+    return data
+
+
+def zobrist_key(row: int, col: int, color: str, state: str) -> int:
+    # The random looking 64 bit number for one jewel in Game.fingerprint,
+    # or 0 for an empty tile. It's worked out from the tile, color and
+    # state with the splitmix64 mixer instead of read from a table, so it's
+    # the same in every process.
+    if color == ' ':
+        return 0
+    return zobrist_mix((row << 40) ^ (col << 20) ^ (ord(color) << 4) ^ _STATE_NUMBERS[state])
+
+
+def zobrist_mix(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class CascadeStep:
+    # One step of a cascade from Game.cascade: the (row, col, color) of
+    # every jewel it cleared, and the columns whose jewels shifted down
+    # afterwards, in order
+    __slots__ = ('matched', 'shifted')
+
+    def __init__(self, matched: list[tuple[int, int, str]], shifted: list[int]):
+        self.matched = matched
+        self.shifted = shifted
+
+    def cleared(self) -> int:
+        # number of jewels cleared
+        return len(self.matched)
+
+
+class Faller:
+    # The three jewels of a faller: the column they're in, the row of the
+    # bottom jewel, and their colors from top to bottom. The jewels always
+    # sit in one column on top of each other, so this is all the game needs
+    # to keep, and moving the faller only changes col or row.
+    __slots__ = ('col', 'row', 'top', 'mid', 'bot')
+
+    def __init__(self, col: int, row: int, top: str, mid: str, bot: str):
+        self.col = col
+        self.row = row
+        self.top = top
+        self.mid = mid
+        self.bot = bot
+
+    def copy(self) -> 'Faller':
+        return Faller(self.col, self.row, self.top, self.mid, self.bot)
+
+    def color_at(self, row: int) -> str:
+        # the color of the jewel in the given board row
+        if row == self.row:
+            return self.bot
+        elif row == self.row - 1:
+            return self.mid
+        else:
+            return self.top
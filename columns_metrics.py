@@ -0,0 +1,136 @@
+import collections
+import json
+import time
+
+
+# Opt-in timing for Game and ColumnsGame. Nothing here runs unless
+# instrument() is called on a game: it replaces the methods on that one
+# instance with timed versions, so games that aren't instrumented run the
+# plain methods with no extra cost.
+
+_GAME_METHODS = ('add_faller', 'clear', '_check_for_matches',
+                 '_check_dirty_for_matches', '_shift_all_down')
+
+
+class Metrics:
+    # Keeps the call count and total of every recorded value, plus the most
+    # recent samples for working out percentiles.
+    def __init__(self, samples: int = 10000):
+        self._samples = samples
+        self._calls = {}
+        self._totals = {}
+        self._recent = {}
+        # cascade steps and jewels cleared so far by the current cascade,
+        # which can run over many moves
+        self._chain_depth = 0
+        self._chain_cleared = 0
+
+    def record(self, name: str, value: float) -> None:
+        if name not in self._calls:
+            self._calls[name] = 0
+            self._totals[name] = 0.0
+            self._recent[name] = collections.deque(maxlen=self._samples)
+        self._calls[name] += 1
+        self._totals[name] += value
+        self._recent[name].append(value)
+
+    def summary(self) -> dict[str, dict]:
+        # For every name: calls, total, mean, and the 50th, 90th and 99th
+        # percentile and max of the recent samples. Timings are in seconds.
+        summary = {}
+        for name, calls in self._calls.items():
+            recent = sorted(self._recent[name])
+            summary[name] = {
+                'calls': calls,
+                'total': self._totals[name],
+                'mean': self._totals[name] / calls,
+                'p50': _percentile(recent, 0.5),
+                'p90': _percentile(recent, 0.9),
+                'p99': _percentile(recent, 0.99),
+                'max': recent[-1],
+            }
+        return summary
+
+    def write_jsonl(self, file) -> None:
+        # Writes one JSON object per line for each name in the summary.
+        # file is a path or an open text file.
+        if isinstance(file, str):
+            with open(file, 'a') as f:
+                self.write_jsonl(f)
+            return
+        now = time.time()
+        for name, values in self.summary().items():
+            file.write(json.dumps(dict(name=name, time=now, **values)) + '\n')
+
+    def overlay_lines(self) -> list[str]:
+        # Short lines of text for drawing on screen: timings in
+        # milliseconds, other values as they are
+        lines = []
+        for name, values in self.summary().items():
+            if name in ('cascade_depth', 'cells_cleared'):
+                lines.append(f'{name} mean {values["mean"]:.2f} max {values["max"]:g}')
+            else:
+                lines.append(f'{name} x{values["calls"]} '
+                             f'p50 {values["p50"] * 1000:.3f} '
+                             f'p99 {values["p99"] * 1000:.3f} ms')
+        return lines
+
+    def _end_tick(self, pending: bool) -> None:
+        # a move clears at most one step of a cascade, so the cascade is
+        # recorded on the first move that leaves no matches to clear
+        if self._chain_depth > 0 and not pending:
+            self.record('cascade_depth', self._chain_depth)
+            self.record('cells_cleared', self._chain_cleared)
+            self._chain_depth = 0
+            self._chain_cleared = 0
+
+    def _count_clear(self, cleared: int) -> None:
+        self._chain_depth += 1
+        self._chain_cleared += cleared
+
+
+def instrument(game, metrics: Metrics) -> None:
+    # Times the hot methods of a Game (or a subclass such as ArrayGame) and
+    # records the depth and jewels cleared of every cascade.
+    for name in _GAME_METHODS:
+        setattr(game, name, _timed(metrics, name, getattr(game, name)))
+    clear_matches = _timed(metrics, '_clear_matches', game._clear_matches)
+
+    def counted_clear_matches() -> list[tuple[int, int, str]]:
+        cleared = clear_matches()
+        metrics._count_clear(len(cleared))
+        return cleared
+
+    game._clear_matches = counted_clear_matches
+    move = _timed(metrics, 'move', game.move)
+
+    def counted_move() -> None:
+        try:
+            move()
+        finally:
+            # the last step of a cascade has already checked for the
+            # matches it made, so the count is up to date
+            metrics._end_tick(game._match_count > 0)
+
+    game.move = counted_move
+
+
+def instrument_method(obj, name: str, metrics: Metrics) -> None:
+    # Times one method of any object, such as ColumnsGame._redraw
+    setattr(obj, name, _timed(metrics, name, getattr(obj, name)))
+
+
+def _timed(metrics: Metrics, name: str, method):
+    clock = time.perf_counter
+
+    def timed(*args, **kwargs):
+        begin = clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.record(name, clock() - begin)
+    return timed
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
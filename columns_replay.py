@@ -0,0 +1,273 @@
+import columns_game
+
+
+# Records every call made on a Game into a small binary stream and plays
+# it back headless. A recording starts with a header:
+#
+#   b'CLRP', version, then varints for rows, columns, undo_limit, seed,
+#   and the length of a tick in nanoseconds
+#
+# followed by one token per event, each a varint whose low 3 bits are the
+# kind of event. For ticks and inputs the rest of the token is how many
+# times in a row it happened, so a long stretch of ticks with no input is
+# a byte or two. For a faller the rest is its column, and the token is
+# followed by the three color characters. A session is a few bytes a
+# second instead of the tens a JSON line per event would take.
+
+_MAGIC = b'CLRP'
+_VERSION = 1
+
+_TICK = 0
+_LEFT = 1
+_RIGHT = 2
+_ROTATE = 3
+_UNDO = 4
+_FALLER = 5
+
+# the Game method each kind of event calls
+_METHODS = {_TICK: 'move', _LEFT: 'move_faller_left', _RIGHT: 'move_faller_right',
+            _ROTATE: 'rotate_faller', _UNDO: 'undo'}
+
+
+class Recorder:
+    def __init__(self, file, rows: int, columns: int, seed: int,
+                 undo_limit: int = 0, tick_ns: int = 1_000_000_000):
+        # file is an open binary file. seed is whatever the fallers were
+        # picked with; it isn't needed for playback, since every faller
+        # is recorded, but says where the session came from.
+        self._file = file
+        # the event waiting to be written and how many times in a row it
+        # has happened
+        self._pending = None
+        self._count = 0
+        self._events = 0
+        self._file.write(_MAGIC + bytes([_VERSION]) + _varints(
+            [rows, columns, undo_limit, seed, tick_ns]))
+
+    def tick(self) -> None:
+        self._repeat(_TICK)
+
+    def left(self) -> None:
+        self._repeat(_LEFT)
+
+    def right(self) -> None:
+        self._repeat(_RIGHT)
+
+    def rotate(self) -> None:
+        self._repeat(_ROTATE)
+
+    def undo(self) -> None:
+        self._repeat(_UNDO)
+
+    def faller(self, faller: str) -> None:
+        # faller is the string given to Game.add_faller: 'col a b c', where
+        # each color is one character
+        col, *colors = faller.split(' ')
+        if len(colors) != 3 or any(len(color) != 1 for color in colors):
+            raise ValueError(f'cannot record faller {faller!r}')
+        self._flush()
+        self._events += 1
+        self._file.write(_varints([int(col) << 3 | _FALLER]) + ''.join(colors).encode('ascii'))
+
+    def events(self) -> int:
+        # number of events recorded so far
+        return self._events
+
+    def close(self) -> None:
+        # writes the last run of events; the file itself is left open
+        self._flush()
+
+    def _repeat(self, kind: int) -> None:
+        self._events += 1
+        if kind != self._pending:
+            self._flush()
+            self._pending = kind
+        self._count += 1
+
+    def _flush(self) -> None:
+        if self._pending is not None:
+            self._file.write(_varints([self._count << 3 | self._pending]))
+            self._pending = None
+            self._count = 0
+
+
+def record(game: columns_game.Game, recorder: Recorder) -> None:
+    # Records every add_faller, move, move_faller_left, move_faller_right,
+    # rotate_faller and undo made on game from now on, the same way
+    # columns_metrics.instrument times them: by replacing the methods on
+    # this one instance. Each event is recorded before it runs, so a call
+    # that ends the game is in the recording too.
+    add_faller = game.add_faller
+
+    def recorded_add_faller(faller: str) -> None:
+        recorder.faller(faller)
+        add_faller(faller)
+
+    game.add_faller = recorded_add_faller
+    for name, log in (('move', recorder.tick), ('move_faller_left', recorder.left),
+                      ('move_faller_right', recorder.right),
+                      ('rotate_faller', recorder.rotate), ('undo', recorder.undo)):
+        setattr(game, name, _recorded(getattr(game, name), log))
+
+
+def _recorded(method, log):
+    def recorded():
+        log()
+        return method()
+    return recorded
+
+
+class ReplayPlayer:
+    # Plays a recording into a headless game as fast as it can. Every
+    # keyframe_ticks ticks the player keeps a snapshot of the game, so
+    # seeking only plays the events since the nearest keyframe before the
+    # target. Snapshots share unchanged rows with the game (see
+    # Game.clone), so they're cheap to keep.
+    def __init__(self, data: bytes, game_class: type = columns_game.Game,
+                 keyframe_ticks: int = 300):
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError('not a Columns recording')
+        if data[len(_MAGIC)] != _VERSION:
+            raise ValueError(f'unsupported recording version {data[len(_MAGIC)]}')
+        pos = len(_MAGIC) + 1
+        header = []
+        for i in range(5):
+            value, pos = _read_varint(data, pos)
+            header.append(value)
+        self._rows, self._columns, self._undo_limit, self._seed, self._tick_ns = header
+        self._game_class = game_class
+        self._keyframe_ticks = keyframe_ticks
+        # every event as (kind, faller string or None), and the index in
+        # events just after each tick, with tick_ends[0] for the start
+        self._events = []
+        self._tick_ends = [0]
+        self._decode(data, pos)
+        self._game = game_class(self._rows, self._columns, ['EMPTY'],
+                                undo_limit=self._undo_limit)
+        self._next = 0
+        self._tick = 0
+        self._game_over = False
+        # keyframes[k] is (snapshot, undo history) at tick k * keyframe_ticks
+        self._keyframes = []
+        self._keep_keyframe()
+
+    def _decode(self, data: bytes, pos: int) -> None:
+        while pos < len(data):
+            token, pos = _read_varint(data, pos)
+            kind = token & 7
+            if kind == _FALLER:
+                colors = data[pos:pos + 3].decode('ascii')
+                pos += 3
+                self._events.append((_FALLER, f'{token >> 3} {" ".join(colors)}'))
+            elif kind in _METHODS:
+                for i in range(token >> 3):
+                    self._events.append((kind, None))
+                    if kind == _TICK:
+                        self._tick_ends.append(len(self._events))
+            else:
+                raise ValueError(f'bad event in recording at byte {pos}')
+
+    def game(self) -> columns_game.Game:
+        return self._game
+
+    def seed(self) -> int:
+        return self._seed
+
+    def ticks(self) -> int:
+        # number of ticks in the whole recording
+        return len(self._tick_ends) - 1
+
+    def position(self) -> int:
+        # number of ticks played so far
+        return self._tick
+
+    def seconds(self) -> float:
+        # how far into the session the player is, in seconds
+        return self._tick * self._tick_ns / 1_000_000_000
+
+    def game_over(self) -> bool:
+        return self._game_over
+
+    def step(self) -> bool:
+        # Plays the next event. Returns False at the end of the recording
+        # or once the game is over.
+        if self._next >= len(self._events) or self._game_over:
+            return False
+        kind, faller = self._events[self._next]
+        self._next += 1
+        try:
+            if kind == _FALLER:
+                self._game.add_faller(faller)
+            else:
+                getattr(self._game, _METHODS[kind])()
+        except columns_game.GameOverError:
+            self._game_over = True
+        if kind == _TICK:
+            self._tick += 1
+            if self._tick % self._keyframe_ticks == 0:
+                self._keep_keyframe()
+        return True
+
+    def play(self) -> None:
+        # plays the rest of the recording
+        while self.step():
+            pass
+
+    def seek(self, tick: int) -> None:
+        # Puts the game where it was just after tick ticks, before any
+        # input that came after it. Starts from the nearest keyframe unless
+        # the player is already between it and tick.
+        tick = max(0, min(tick, self.ticks()))
+        k = min(tick // self._keyframe_ticks, len(self._keyframes) - 1)
+        if not k * self._keyframe_ticks <= self._tick <= tick or self._next > self._tick_ends[tick]:
+            self._load_keyframe(k)
+        while self._next < self._tick_ends[tick] and self.step():
+            pass
+
+    def seek_seconds(self, seconds: float) -> None:
+        # seeks to the tick that was running at seconds into the session
+        self.seek(int(seconds * 1_000_000_000 // self._tick_ns))
+
+    def _keep_keyframe(self) -> None:
+        # keyframes are only added going forward, so any earlier ones are
+        # already there
+        if len(self._keyframes) * self._keyframe_ticks == self._tick:
+            undo = None if self._game._undo is None else list(self._game._undo)
+            self._keyframes.append((self._game.snapshot(), undo))
+
+    def _load_keyframe(self, k: int) -> None:
+        snapshot, undo = self._keyframes[k]
+        self._game.restore(snapshot)
+        if undo is not None:
+            self._game._undo.clear()
+            self._game._undo.extend(undo)
+        self._tick = k * self._keyframe_ticks
+        self._next = self._tick_ends[self._tick]
+        self._game_over = False
+
+
+def _varints(values: list[int]) -> bytes:
+    # LEB128: seven bits at a time, low bits first, with the high bit set
+    # on every byte but the last
+    out = bytearray()
+    for value in values:
+        if value < 0:
+            raise ValueError(f'cannot encode negative number {value}')
+        while value > 0x7F:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    # returns the varint at pos and the position just after it
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+import columns_game
+import columns_metrics
+import columns_sim
+import columns_timing
+
+
+# Hosts versus matches over TCP. Every game in the process lives in one
+# asyncio event loop and is moved by one shared tick loop. Players send
+# the commands from the original text version of the game, one per line:
+#   '<', '>', 'R'  move or rotate the faller
+#   ''             move the game now, without waiting for the next tick
+#   'F col a b c'  create a faller (only if the server doesn't pick them)
+#   'Q'            leave the match
+# The server sends:
+#   'JOIN match player rows columns'  when the player is put in a match
+#   'START players'                   when the match is full and begins
+#   'T tick'                          at the start of each tick's update
+#   'D player row,col,CS ...'         the tiles of a board that changed,
+#                                     C the color ('.' for empty) and S
+#                                     the state, 0 frozen, 1 falling,
+#                                     2 landed, 3 matched
+#   'OVER player'                     when a player's game ends
+#   'END winner'                      when the match ends, -1 for no winner
+#   'ERROR message'                   for a bad command
+# Boards are only sent as the tiles that changed since the last update,
+# and the fingerprint tells which boards didn't change at all without
+# looking at them.
+
+_STATE_DIGITS = {'FROZEN': '0', 'FALL': '1', 'LANDED': '2', 'MATCH': '3'}
+
+
+class _Player:
+    __slots__ = ('index', 'game', 'rng', 'writer', 'over', 'last_frame',
+                 'last_fingerprint')
+
+    def __init__(self, index: int, game: columns_game.Game, seed: int, writer):
+        self.index = index
+        self.game = game
+        # every player in a match gets the same fallers in the same order
+        self.rng = random.Random(seed)
+        self.writer = writer
+        self.over = False
+        # the board as last sent, one tuple of (color, state) per row
+        self.last_frame = [((' ', 'FROZEN'),) * game.columns()] * game.rows()
+        self.last_fingerprint = 0
+
+
+class _Match:
+    __slots__ = ('id', 'players', 'joined', 'seed', 'started', 'ended', 'tick')
+
+    def __init__(self, id: int, seed: int):
+        self.id = id
+        self.players = []
+        # number of players who have joined, counting any who left before
+        # the start, so every player keeps their own index
+        self.joined = 0
+        self.seed = seed
+        self.started = False
+        # set once END has been sent, so the match is only ended once
+        self.ended = False
+        self.tick = 0
+
+
+class GameServer:
+    def __init__(self, rows: int = 13, columns: int = 6, players: int = 2,
+                 tick_rate: float = 1.0, game_class: type = columns_game.Game,
+                 server_fallers: bool = True, seed: int = 0, batch: int = 256,
+                 max_buffer: int = 1 << 20, metrics: columns_metrics.Metrics = None):
+        # players is how many players a match waits for. With
+        # server_fallers, the server adds a random faller whenever a game
+        # needs one, the way ColumnsGame does, and 'F' commands are
+        # refused. Each tick yields to the event loop after every batch
+        # games, so input keeps being read while thousands of games are
+        # moved. A player whose unsent output passes max_buffer bytes is
+        # too slow to keep up and is dropped. If metrics is given, each
+        # tick's time is recorded in it as 'server_tick'.
+        self._rows = rows
+        self._columns = columns
+        self._players = players
+        self._tick_rate = tick_rate
+        self._game_class = game_class
+        self._server_fallers = server_fallers
+        self._seed = seed
+        self._batch = batch
+        self._max_buffer = max_buffer
+        self._metrics = metrics
+        self._matches = {}
+        self._open_match = None
+        self._next_match = 0
+        self._server = None
+        self._ticker = None
+        # the task reading from each connection
+        self._readers = set()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        # Starts listening and ticking, and returns the port, which is
+        # picked by the system if port is 0. The backlog is long so
+        # thousands of players connecting at once aren't turned away and
+        # left to retry.
+        self._server = await asyncio.start_server(self._connected, host, port, backlog=4096)
+        self._ticker = asyncio.create_task(self._tick_loop())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        # stops ticking, disconnects every player, and waits for their
+        # connections to finish closing
+        self._ticker.cancel()
+        try:
+            await self._ticker
+        except asyncio.CancelledError:
+            pass
+        self._server.close()
+        for match in list(self._matches.values()):
+            for player in match.players:
+                player.writer.close()
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def matches(self) -> int:
+        # number of matches waiting for players or being played
+        return len(self._matches)
+
+    async def _connected(self, reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+        match = self._open_match
+        if match is None:
+            match = _Match(self._next_match, self._seed + self._next_match)
+            self._next_match += 1
+            self._matches[match.id] = match
+            self._open_match = match
+        game = self._game_class(self._rows, self._columns, ['EMPTY'])
+        player = _Player(match.joined, game, match.seed, writer)
+        match.joined += 1
+        match.players.append(player)
+        writer.write(f'JOIN {match.id} {player.index} {self._rows} {self._columns}\n'.encode())
+        if len(match.players) == self._players:
+            self._open_match = None
+            match.started = True
+            self._broadcast(match, f'START {self._players}\n'.encode())
+            if self._server_fallers:
+                for other in match.players:
+                    self._add_faller_if_needed(match, other)
+        self._readers.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                self._command(match, player, line.decode('ascii', 'replace').strip())
+        except ConnectionError:
+            pass
+        finally:
+            self._leave(match, player)
+            self._readers.discard(asyncio.current_task())
+
+    def _command(self, match: _Match, player: _Player, command: str) -> None:
+        # carries out one line from a player. Input before the match
+        # starts or after the player's game is over is ignored.
+        game = player.game
+        if command == 'Q':
+            self._leave(match, player)
+            return
+        if not match.started or player.over:
+            return
+        try:
+            if command == '<':
+                game.move_faller_left()
+            elif command == '>':
+                game.move_faller_right()
+            elif command == 'R':
+                if game.faller_exists():
+                    game.rotate_faller()
+            elif command == '':
+                game.move()
+                self._add_faller_if_needed(match, player)
+            elif (command.startswith('F ') and not self._server_fallers
+                    and _valid_faller(command[2:], game.columns())):
+                game.add_faller(command[2:])
+            else:
+                player.writer.write(f'ERROR bad command {command!r}\n'.encode())
+        except (ValueError, IndexError):
+            player.writer.write(f'ERROR bad command {command!r}\n'.encode())
+        except columns_game.GameOverError:
+            self._game_over(match, player)
+
+    def _add_faller_if_needed(self, match: _Match, player: _Player) -> None:
+        # the same as ColumnsGame._add_faller_if_needed
+        game = player.game
+        if self._server_fallers and not game.faller_exists() and not game.has_matches():
+            try:
+                game.add_faller(columns_sim.random_faller(game, player.rng)[2:])
+            except columns_game.GameOverError:
+                self._game_over(match, player)
+
+    async def _tick_loop(self) -> None:
+        scheduler = columns_timing.FixedStepScheduler(self._tick_rate)
+        scheduler.ticks_due()
+        while True:
+            for tick in range(scheduler.ticks_due()):
+                begin = time.perf_counter()
+                await self._tick()
+                if self._metrics is not None:
+                    self._metrics.record('server_tick', time.perf_counter() - begin)
+            # sleep until the next tick is due
+            await asyncio.sleep((1 - scheduler.progress()) / self._tick_rate)
+
+    async def _tick(self) -> None:
+        # moves every game in every started match, then sends each match
+        # one update with the changes to all of its boards
+        moved = 0
+        for match in list(self._matches.values()):
+            if not match.started:
+                continue
+            match.tick += 1
+            for player in match.players:
+                if not player.over:
+                    try:
+                        player.game.move()
+                    except columns_game.GameOverError:
+                        self._game_over(match, player)
+                    self._add_faller_if_needed(match, player)
+            self._send_update(match)
+            moved += len(match.players)
+            if moved >= self._batch:
+                moved = 0
+                await asyncio.sleep(0)
+
+    def _send_update(self, match: _Match) -> None:
+        lines = [f'T {match.tick}\n']
+        for player in match.players:
+            fingerprint = player.game.fingerprint()
+            if fingerprint == player.last_fingerprint:
+                continue
+            player.last_fingerprint = fingerprint
+            frame = [tuple((cell[0], cell[1]) for cell in row) for row in player.game.state()]
+            changed = []
+            for row in range(len(frame)):
+                if frame[row] == player.last_frame[row]:
+                    continue
+                for col, (color, state) in enumerate(frame[row]):
+                    if (color, state) != player.last_frame[row][col]:
+                        if color == ' ':
+                            color = '.'
+                        changed.append(f'{row},{col},{color}{_STATE_DIGITS[state]}')
+            player.last_frame = frame
+            if changed != []:
+                lines.append(f'D {player.index} {" ".join(changed)}\n')
+        self._broadcast(match, ''.join(lines).encode())
+
+    def _broadcast(self, match: _Match, data: bytes) -> None:
+        # players too far behind to ever catch up are dropped once every
+        # other player has been sent data, since dropping one sends more
+        slow = []
+        for player in match.players:
+            if player.writer.is_closing():
+                continue
+            if player.writer.transport.get_write_buffer_size() > self._max_buffer:
+                slow.append(player)
+            else:
+                player.writer.write(data)
+        for player in slow:
+            player.writer.close()
+            self._game_over(match, player)
+
+    def _game_over(self, match: _Match, player: _Player) -> None:
+        if player.over:
+            return
+        player.over = True
+        self._broadcast(match, f'OVER {player.index}\n'.encode())
+        alive = [other for other in match.players if not other.over]
+        # a versus match ends when one player is left; a match of one
+        # ends when its game does. Sending OVER can drop a slow player,
+        # which may already have ended the match.
+        if (match.started and not match.ended
+                and len(alive) <= (1 if self._players > 1 else 0)):
+            match.ended = True
+            winner = alive[0].index if alive != [] else -1
+            self._broadcast(match, f'END {winner}\n'.encode())
+            for other in match.players:
+                other.over = True
+                other.writer.close()
+            del self._matches[match.id]
+
+    def _leave(self, match: _Match, player: _Player) -> None:
+        # a player who leaves loses; one who leaves before the match
+        # starts gives up their place
+        if not match.started and not player.over:
+            match.players.remove(player)
+            player.over = True
+            if match.players == []:
+                if self._open_match is match:
+                    self._open_match = None
+                del self._matches[match.id]
+        else:
+            self._game_over(match, player)
+        player.writer.close()
+
+
+def _valid_faller(faller: str, columns: int) -> bool:
+    # checks a faller from the network before it gets to Game.add_faller,
+    # which takes it on trust: 'col a b c', with col from 1 to columns
+    # and each color one character
+    col, *colors = faller.split(' ')
+    return (col.isascii() and col.isdigit() and 1 <= int(col) <= columns
+            and len(colors) == 3 and all(len(color) == 1 for color in colors))
+
+
+async def load_test(host: str, port: int, clients: int, ticks: int,
+                    input_chance: float = 0.3, seed: int = 0) -> dict[str, dict]:
+    # Connects clients players to a server and has each one send a random
+    # input after some of its board updates, until it has seen ticks
+    # ticks or its match ends. clients should be a multiple of the
+    # server's players per match, or the last match never starts.
+    # Returns columns_metrics summaries of the time between ticks, the
+    # time from an input to the next update of the player's board, and
+    # the bytes and lines received per tick.
+    metrics = columns_metrics.Metrics()
+    rng = random.Random(seed)
+    tasks = [asyncio.create_task(_load_client(host, port, ticks, input_chance,
+                                              random.Random(rng.random()), metrics))
+             for i in range(clients)]
+    await asyncio.gather(*tasks)
+    return metrics.summary()
+
+
+async def _load_client(host: str, port: int, ticks: int, input_chance: float,
+                       rng: random.Random, metrics: columns_metrics.Metrics) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    clock = time.perf_counter
+    me = None
+    seen = 0
+    last_tick = None
+    sent = None
+    tick_bytes = 0
+    tick_lines = 0
+    try:
+        while seen < ticks:
+            line = await reader.readline()
+            if line == b'':
+                break
+            tick_bytes += len(line)
+            tick_lines += 1
+            parts = line.split(b' ', 2)
+            if parts[0] == b'JOIN':
+                me = line.split()[2]
+            elif parts[0] == b'T':
+                now = clock()
+                if last_tick is not None:
+                    metrics.record('tick_gap', now - last_tick)
+                    metrics.record('tick_bytes', tick_bytes)
+                    metrics.record('tick_lines', tick_lines)
+                last_tick = now
+                tick_bytes = 0
+                tick_lines = 0
+                seen += 1
+            elif parts[0] == b'D' and parts[1] == me:
+                if sent is not None:
+                    metrics.record('input_latency', clock() - sent)
+                    sent = None
+                if rng.random() < input_chance:
+                    writer.write(rng.choice((b'<\n', b'>\n', b'R\n')))
+                    sent = clock()
+            elif parts[0] == b'END':
+                break
+        writer.write(b'Q\n')
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve(args) -> None:
+    server = GameServer(args.rows, args.columns, args.players, args.tick_rate)
+    port = await server.start(args.host, args.port)
+    print(f'listening on {args.host}:{port}')
+    await asyncio.Event().wait()
+
+
+async def _load(args) -> None:
+    metrics = columns_metrics.Metrics()
+    server = None
+    port = args.port
+    if args.local:
+        server = GameServer(args.rows, args.columns, args.players, args.tick_rate,
+                            metrics=metrics)
+        port = await server.start(args.host, 0)
+    try:
+        summary = await load_test(args.host, port, args.clients, args.ticks)
+    finally:
+        if server is not None:
+            await server.close()
+    summary.update(metrics.summary())
+    for name, values in summary.items():
+        # times are shown in milliseconds
+        scale, unit = (1, '') if name in ('tick_bytes', 'tick_lines') else (1000, ' ms')
+        print(f'{name:14} x{values["calls"]:<8} p50 {values["p50"] * scale:10.3f} '
+              f'p99 {values["p99"] * scale:10.3f} max {values["max"] * scale:10.3f}{unit}')
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Host Columns matches over TCP.')
+    parser.add_argument('mode', choices=('serve', 'load'),
+                        help='run a server, or a load test against one')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--rows', type=int, default=13)
+    parser.add_argument('--columns', type=int, default=6)
+    parser.add_argument('--players', type=int, default=2, help='players per match')
+    parser.add_argument('--tick-rate', type=float, default=1.0, help='ticks per second')
+    parser.add_argument('--clients', type=int, default=100, help='load test players')
+    parser.add_argument('--ticks', type=int, default=20, help='ticks each load test player waits for')
+    parser.add_argument('--local', action='store_true',
+                        help='load test a server started in this process on a free port')
+    args = parser.parse_args(argv)
+    if args.mode == 'serve':
+        asyncio.run(_serve(args))
+    else:
+        asyncio.run(_load(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
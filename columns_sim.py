@@ -0,0 +1,134 @@
+import random
+import time
+import columns_game
+
+
+# Runs games without a display. Scripts use the commands from the original
+# text version of the game:
+#   'F col a b c'  create a faller in column col with colors a, b, c
+#   '<'            move the faller left
+#   '>'            move the faller right
+#   'R'            rotate the faller
+#   ''             tick (same as a blank line)
+#   'Q'            stop the script early
+
+
+class SimResult:
+    # The final board of a headless run and a summary of what happened
+    def __init__(self, board: list[list['Jems']], stats: dict):
+        self._board = board
+        self._stats = stats
+
+    def board(self) -> list[list['Jems']]:
+        return self._board
+
+    def stats(self) -> dict:
+        return self._stats
+
+    def game_over(self) -> bool:
+        return self._stats['game_over']
+
+
+def run_script(rows: int, columns: int, commands: list[str],
+               start: list[str] = None,
+               game_class: type = columns_game.Game) -> SimResult:
+    # Plays every command in commands on a new game as fast as possible
+    # and returns the final board. The run stops at the end of the script,
+    # at a 'Q' command, or when the game ends.
+    if start is None:
+        start = ['EMPTY']
+    game = game_class(rows, columns, start)
+    return play(game, commands)
+
+
+def run_scripts(rows: int, columns: int, scripts: list[list[str]],
+                start: list[str] = None,
+                game_class: type = columns_game.Game) -> list[SimResult]:
+    # Runs each script on its own game and returns the results in order
+    return [run_script(rows, columns, script, start, game_class)
+            for script in scripts]
+
+
+def play_random(rows: int, columns: int, seed: int, max_ticks: int = 10000,
+                game_class: type = columns_game.Game) -> SimResult:
+    # Plays a whole game the way ColumnsGame does, picking fallers the same
+    # way as ColumnsGame._add_faller_to_random_clear_column, plus a random
+    # left, right, or rotate input on some ticks. Everything random comes
+    # from a generator seeded with seed, so the same seed always plays the
+    # same game.
+    rng = random.Random(seed)
+    game = game_class(rows, columns, ['EMPTY'])
+    commands = _random_commands(game, rng, max_ticks)
+    result = play(game, commands)
+    result.stats()['seed'] = seed
+    return result
+
+
+def random_faller(game: columns_game.Game, rng: random.Random) -> str:
+    # Returns an 'F' command for a new faller, picked the same way as
+    # ColumnsGame._add_faller_to_random_clear_column. Raises GameOverError
+    # if no column has room at the top.
+    free_columns = [col + 1 for col in game.free_columns()]
+    if free_columns == []:
+        raise columns_game.GameOverError
+    c1 = rng.randint(0, 6)
+    c2 = rng.randint(0, 6)
+    c3 = rng.randint(0, 6)
+    column = rng.randint(free_columns[0], free_columns[-1])
+    return f'F {column} {c1} {c2} {c3}'
+
+
+def _random_commands(game: columns_game.Game, rng: random.Random, max_ticks: int):
+    # yields commands for play, looking at the game between commands
+    for tick in range(max_ticks):
+        if not game.faller_exists() and not game.has_matches():
+            yield random_faller(game, rng)
+        elif game.faller_exists():
+            yield rng.choice(('<', '>', 'R', '', '', ''))
+        yield ''
+
+
+def play(game: columns_game.Game, commands: list[str]) -> SimResult:
+    # Plays commands on game, which may already be part way through, and
+    # returns the final board and stats. commands can be a generator that
+    # looks at the game to decide what to do next.
+    played = 0
+    ticks = 0
+    fallers = 0
+    game_over = False
+    begin = time.perf_counter()
+    try:
+        for command in commands:
+            command = command.strip()
+            played += 1
+            if command == '':
+                ticks += 1
+                game.move()
+            elif command == '<':
+                game.move_faller_left()
+            elif command == '>':
+                game.move_faller_right()
+            elif command == 'R':
+                if game.faller_exists():
+                    game.rotate_faller()
+            elif command.startswith('F '):
+                if not game.faller_exists():
+                    fallers += 1
+                game.add_faller(command[2:])
+            elif command == 'Q':
+                break
+            else:
+                raise ValueError(f'unknown command: {command!r}')
+    except columns_game.GameOverError:
+        game_over = True
+    seconds = time.perf_counter() - begin
+    stats = {
+        'commands': played,
+        'ticks': ticks,
+        'fallers': fallers,
+        'jewels_cleared': game.jewels_cleared(),
+        'game_over': game_over,
+        'seconds': seconds,
+        'commands_per_second': played / seconds if seconds > 0 else 0.0,
+    }
+    return SimResult(game.state(), stats)
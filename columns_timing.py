@@ -0,0 +1,51 @@
+import time
+
+
+class FixedStepScheduler:
+    # Decides how many simulation ticks to run each frame so the game moves
+    # at a fixed tick rate no matter how fast frames are drawn. Time that
+    # hasn't made up a whole tick yet is kept in an accumulator and carried
+    # into the next frame. Time is counted in integer nanoseconds so the
+    # accumulator doesn't drift.
+    def __init__(self, tick_rate: float = 1.0, max_lag: float = 0.25,
+                 clock=time.perf_counter_ns):
+        # tick_rate is in ticks per second. If a frame stalls, only the
+        # last max_lag seconds of missed time are caught up and the rest
+        # is dropped, so one long stall can't snowball into more and more
+        # ticks per frame. The limit is a time rather than a number of
+        # ticks so high tick rates aren't capped by the frame rate.
+        # clock returns the time in nanoseconds.
+        if tick_rate <= 0:
+            raise ValueError('tick_rate must be positive')
+        self._step = round(1_000_000_000 / tick_rate)
+        # always allow at least one tick's worth of time
+        self._max_lag = max(round(max_lag * 1_000_000_000), self._step)
+        self._clock = clock
+        self._last = None
+        self._accumulator = 0
+        self._ticks = 0
+
+    def ticks_due(self, now: int = None) -> int:
+        # Returns how many ticks to run now. The first call only starts
+        # the clock.
+        if now is None:
+            now = self._clock()
+        if self._last is None:
+            self._last = now
+            return 0
+        self._accumulator += now - self._last
+        self._last = now
+        if self._accumulator > self._max_lag:
+            self._accumulator = self._max_lag
+        due = self._accumulator // self._step
+        self._accumulator -= due * self._step
+        self._ticks += due
+        return due
+
+    def progress(self) -> float:
+        # how far the game is into the next tick, from 0 to 1
+        return self._accumulator / self._step
+
+    def ticks(self) -> int:
+        # total number of ticks handed out so far
+        return self._ticks
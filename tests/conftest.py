@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# the modules are flat files at the top of the repo rather than a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
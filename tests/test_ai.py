@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+import columns_ai
+import columns_array
+import columns_game
+
+
+GAME_CLASSES = [columns_game.Game, columns_array.ArrayGame]
+
+
+def _random_board(rng: random.Random, game_class: type) -> columns_game.Game:
+    rows, columns = rng.randint(3, 10), rng.randint(1, 6)
+    start = [''.join(rng.choice('ABCD  ') for col in range(columns)) for row in range(rows)]
+    game = game_class(rows, columns, ['CONTENTS'] + start)
+    game.clear()
+    return game
+
+
+@pytest.mark.parametrize('game_class', GAME_CLASSES)
+def test_drop_faller_lands_like_move(game_class):
+    rng = random.Random(0)
+    for board in range(500):
+        dropped = _random_board(rng, game_class)
+        moved = dropped.clone()
+        faller = f'{rng.randint(1, dropped.columns())} A B C'
+        results = []
+        for game, drop in ((moved, False), (dropped, True)):
+            try:
+                game.add_faller(faller)
+                if drop:
+                    game.drop_faller()
+                while game.faller_exists():
+                    game.move()
+                results.append(game.state())
+            except columns_game.GameOverError:
+                results.append(None)
+        assert results[0] == results[1]
+        if results[1] is not None:
+            assert dropped.fingerprint() == dropped._compute_fingerprint()
+
+
+@pytest.mark.parametrize('game_class', GAME_CLASSES)
+def test_column_heights_leave_out_faller(game_class):
+    game = game_class(6, 3, ['CONTENTS', '   ', '   ', '   ', '   ', 'A  ', 'BC '])
+    game.add_faller('1 A B C')
+    game.move()
+    assert game.column_heights() == [2, 1, 0]
+
+
+@pytest.mark.parametrize('game_class', GAME_CLASSES)
+def test_search_heights_match_board(game_class, monkeypatch):
+    # the search works out each placement's column heights from the
+    # jewels it clears instead of scanning the board again
+    score = columns_ai._score
+
+    def checked_score(game, heights, cleared, depth):
+        assert heights == game.column_heights()
+        return score(game, heights, cleared, depth)
+
+    monkeypatch.setattr(columns_ai, '_score', checked_score)
+    for seed in range(3):
+        columns_ai.play_auto(20, 8, seed, max_ticks=500, game_class=game_class,
+                             player=columns_ai.AutoPlayer(time_budget=None))
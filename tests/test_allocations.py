@@ -0,0 +1,46 @@
+import tracemalloc
+
+import pytest
+
+import columns_array
+import columns_game
+
+
+# Moving a faller updates the tiles in place, so playing many ticks must
+# not leave memory behind in the game modules. The only thing a tick may
+# keep is the new fingerprint int, which replaces the old one.
+
+TICKS = 200
+
+
+@pytest.mark.parametrize('game_class', [columns_game.Game, columns_array.ArrayGame])
+def test_faller_ticks_hold_no_memory(game_class):
+    # the board is tall enough that the faller is still falling after
+    # every tick
+    game = game_class(TICKS + 50, 6, ['EMPTY'])
+    game.add_faller('3 A B C')
+    for tick in range(5):
+        _tick(game)
+    modules = [tracemalloc.Filter(True, columns_game.__file__),
+               tracemalloc.Filter(True, columns_array.__file__)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(modules)
+        for tick in range(TICKS):
+            _tick(game)
+        after = tracemalloc.take_snapshot().filter_traces(modules)
+    finally:
+        tracemalloc.stop()
+    assert game.faller_exists()
+    stats = after.compare_to(before, 'lineno')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    assert blocks <= 2, stats[:5]
+    assert size <= 128, stats[:5]
+
+
+def _tick(game: columns_game.Game) -> None:
+    game.move()
+    game.move_faller_left()
+    game.move_faller_right()
+    game.rotate_faller()
@@ -0,0 +1,145 @@
+import random
+
+import pytest
+
+import columns_game
+
+pytest.importorskip('pytest_benchmark')
+
+try:
+    import columns_array
+except ImportError:
+    # NumPy isn't installed, so only the list board is benchmarked
+    columns_array = None
+
+
+# Benchmarks for the hot paths of Game, from the 13x6 board ColumnsGame
+# uses up to 1000x200, run with pytest-benchmark. They are skipped if it
+# isn't installed. To keep a baseline and fail on any case whose best
+# time gets more than 20% slower:
+#
+#   pytest tests/test_benchmarks.py --benchmark-only --benchmark-save=baseline
+#   pytest tests/test_benchmarks.py --benchmark-only \
+#       --benchmark-compare --benchmark-compare-fail=min:20%
+#
+# Results are saved as JSON under .benchmarks. Each case has an untimed
+# setup, so every round starts from the same board.
+
+_SIZES = [(13, 6), (100, 40), (1000, 200)]
+_COLORS = '0123456'
+
+# the biggest boards take a second or more per round
+_ROUNDS = {(13, 6): 200, (100, 40): 20, (1000, 200): 3}
+
+_BACKENDS = [pytest.param(columns_game.Game, id='list')]
+if columns_array is not None:
+    _BACKENDS.append(pytest.param(columns_array.ArrayGame, id='array'))
+
+_SIZE_PARAMS = [pytest.param(size, id=f'{size[0]}x{size[1]}') for size in _SIZES]
+
+
+def _random_rows(rows: int, columns: int, rng: random.Random, colors: str = _COLORS,
+                 filled_rows: int = None) -> list[str]:
+    # rows of random jewels; only the bottom filled_rows rows have jewels
+    if filled_rows is None:
+        filled_rows = rows
+    return [' ' * columns if i < rows - filled_rows
+            else ''.join(rng.choice(colors) for j in range(columns))
+            for i in range(rows)]
+
+
+def _gapped_rows(rows: int, columns: int, rng: random.Random) -> list[str]:
+    # every other row is empty, so every jewel has to fall
+    return [''.join(rng.choice(_COLORS) for j in range(columns)) if i % 2 == 0
+            else ' ' * columns
+            for i in range(rows)]
+
+
+def _unsettled_game(game_class: type, rows: list[str]) -> columns_game.Game:
+    # a game holding rows exactly as given, without shifting the jewels
+    # down or marking matches the way 'CONTENTS' does
+    return columns_game.load_board(_dump(rows), game_class, settle=False)
+
+
+def _dump(rows: list[str]) -> bytes:
+    return ''.join(row + '\n' for row in rows).encode('latin-1')
+
+
+def _run(benchmark, size: tuple[int, int], setup, run) -> None:
+    # times run on a fresh result of setup every round
+    benchmark.pedantic(run, setup=lambda: ((setup(),), {}), rounds=_ROUNDS[size])
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_init_contents(benchmark, game_class, size):
+    rows, columns = size
+    board = _random_rows(rows, columns, random.Random(0))
+    _run(benchmark, size, lambda: ['CONTENTS'] + board,
+         lambda start: game_class(rows, columns, start))
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_load_board(benchmark, game_class, size):
+    data = _dump(_random_rows(*size, random.Random(0)))
+    _run(benchmark, size, lambda: data,
+         lambda data: columns_game.load_board(data, game_class))
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_check_for_matches_dense(benchmark, game_class, size):
+    board = _random_rows(*size, random.Random(0))
+    _run(benchmark, size, lambda: _unsettled_game(game_class, board),
+         lambda game: game._check_for_matches())
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_check_for_matches_sparse(benchmark, game_class, size):
+    rows, columns = size
+    board = _random_rows(rows, columns, random.Random(0), filled_rows=max(1, rows // 10))
+    _run(benchmark, size, lambda: _unsettled_game(game_class, board),
+         lambda game: game._check_for_matches())
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_shift_all_down_gapped(benchmark, game_class, size):
+    board = _gapped_rows(*size, random.Random(0))
+    _run(benchmark, size, lambda: _unsettled_game(game_class, board),
+         lambda game: game._shift_all_down())
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_clear_cascade(benchmark, game_class, size):
+    # few colors, so there are lots of matches and chains
+    rows, columns = size
+    board = _random_rows(rows, columns, random.Random(0), colors='0123')
+    _run(benchmark, size, lambda: game_class(rows, columns, ['CONTENTS'] + board),
+         lambda game: game.clear())
+
+
+@pytest.mark.parametrize('size', _SIZE_PARAMS)
+@pytest.mark.parametrize('game_class', _BACKENDS)
+def test_faller_drops(benchmark, game_class, size):
+    rows, columns = size
+    rng = random.Random(0)
+    fallers = [f'{rng.randint(1, columns)} {rng.choice(_COLORS)} '
+               f'{rng.choice(_COLORS)} {rng.choice(_COLORS)}'
+               for i in range(20)]
+
+    def drop(game):
+        # small boards can fill up before all the fallers are dropped; the
+        # seed is fixed, so every round stops at the same place
+        try:
+            for faller in fallers:
+                game.add_faller(faller)
+                while game.faller_exists():
+                    game.move()
+                game.move()
+        except columns_game.GameOverError:
+            pass
+    _run(benchmark, size, lambda: game_class(rows, columns, ['EMPTY']), drop)
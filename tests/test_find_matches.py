@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+import pytest
+
+import columns_array
+import columns_game
+
+
+# find_matches has to mark exactly the cells that Game._check_for_matches
+# marks MATCH, on boards of every shape, including a single row or column
+# where only one direction of match is possible.
+
+SHAPES = [(1, 1), (1, 2), (1, 3), (1, 12), (2, 2), (3, 1), (12, 1),
+          (2, 7), (7, 2), (3, 3), (6, 4), (13, 6), (20, 20)]
+
+
+def _random_rows(rng: random.Random, rows: int, columns: int, colors: str) -> list[str]:
+    return [''.join(rng.choice(colors) for col in range(columns)) for row in range(rows)]
+
+
+def _game_matches(rows: list[str]) -> set[tuple[int, int]]:
+    # the board is taken as it is, without shifting the jewels down, so
+    # the empty tiles stay where the rows put them
+    game = columns_game.load_board('\n'.join(rows).encode('latin-1'), settle=False)
+    game._check_for_matches()
+    return game._matched_cells()
+
+
+def _array_matches(rows: list[str]) -> set[tuple[int, int]]:
+    colors = np.array([np.frombuffer(row.encode('latin-1'), dtype=np.uint8) for row in rows])
+    matched = columns_array.find_matches(colors)
+    assert matched.shape == colors.shape
+    return set(zip(*(index.tolist() for index in np.nonzero(matched))))
+
+
+@pytest.mark.parametrize('rows, columns', SHAPES)
+@pytest.mark.parametrize('colors', ['AB', 'AB ', 'ABC ', 'ABCDEF  '])
+def test_matches_full_scan(rows, columns, colors):
+    rng = random.Random(f'{rows}x{columns} {colors}')
+    for board in range(50):
+        start = _random_rows(rng, rows, columns, colors)
+        assert _array_matches(start) == _game_matches(start), start
+
+
+@pytest.mark.parametrize('rows, columns', [(1, 9), (9, 1), (5, 5)])
+def test_single_color_board(rows, columns):
+    start = ['A' * columns] * rows
+    expected = {(row, col) for row in range(rows) for col in range(columns)}
+    assert _array_matches(start) == _game_matches(start) == expected
+
+
+def test_empty_board():
+    start = [' ' * 5] * 5
+    assert _array_matches(start) == _game_matches(start) == set()
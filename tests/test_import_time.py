@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+
+# Headless workers import the game modules thousands of times a day, so
+# importing them must not pull in pygame and must stay fast. All of the
+# headless modules together take about 35 ms once they're compiled, about
+# a third of what pygame alone takes. This is the one list of them;
+# anything that needs to know which modules are headless uses it.
+
+HEADLESS_MODULES = ['columns', 'columns_game', 'columns_sim', 'columns_ai',
+                    'columns_replay', 'columns_metrics', 'columns_timing',
+                    'columns_server', 'columns_farm']
+
+IMPORT_SECONDS = 0.1
+
+_IMPORT = f'import {", ".join(HEADLESS_MODULES)}\n'
+
+# compiling the modules takes several times longer than importing them,
+# so the first interpreter writes their bytecode even if the environment
+# turns that off, and only the second one is timed
+_WARM_SCRIPT = 'import sys\nsys.dont_write_bytecode = False\n' + _IMPORT
+
+_TIMED_SCRIPT = f'''
+import sys
+import time
+begin = time.perf_counter()
+{_IMPORT}
+print(time.perf_counter() - begin)
+print('pygame' in sys.modules)
+'''
+
+
+def test_headless_import():
+    # fresh interpreters, so nothing is already imported
+    _run(_WARM_SCRIPT)
+    seconds, pygame_loaded = _run(_TIMED_SCRIPT).split()
+    assert pygame_loaded == 'False'
+    assert float(seconds) < IMPORT_SECONDS
+
+
+def _run(script: str) -> str:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root,
+                            capture_output=True, text=True, check=True)
+    return result.stdout
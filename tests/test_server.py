@@ -0,0 +1,80 @@
+import columns_game
+import columns_server
+
+
+# The server is driven directly here, with fake connections, so each
+# test can put a match in the state it needs without any networking.
+
+class _Transport:
+    def __init__(self, buffered: int):
+        self.buffered = buffered
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffered
+
+
+class _Writer:
+    def __init__(self, buffered: int = 0):
+        self.transport = _Transport(buffered)
+        self.data = b''
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def close(self) -> None:
+        self.closed = True
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+
+def _started_match(server: columns_server.GameServer, writers: list[_Writer]):
+    match = columns_server._Match(0, 0)
+    for writer in writers:
+        game = columns_game.Game(13, 6, ['EMPTY'])
+        match.players.append(columns_server._Player(match.joined, game, 0, writer))
+        match.joined += 1
+    match.started = True
+    server._matches[match.id] = match
+    return match
+
+
+def test_game_over_with_slow_opponent():
+    # OVER for the first player drops the second for being too slow,
+    # which ends the match before the first call gets to end it
+    server = columns_server.GameServer(max_buffer=100)
+    fast = _Writer()
+    slow = _Writer(buffered=1000)
+    match = _started_match(server, [fast, slow])
+    server._game_over(match, match.players[0])
+    assert server.matches() == 0
+    assert fast.data == b'OVER 0\nOVER 1\nEND -1\n'
+    assert slow.data == b''
+    assert fast.closed and slow.closed
+
+
+def test_slow_player_dropped_after_broadcast():
+    server = columns_server.GameServer(players=3, max_buffer=100)
+    writers = [_Writer(), _Writer(buffered=1000), _Writer()]
+    match = _started_match(server, writers)
+    server._broadcast(match, b'T 1\n')
+    # every player still connected gets the update before the slow one
+    # is dropped and the others are told
+    assert writers[0].data == writers[2].data == b'T 1\nOVER 1\n'
+    assert writers[1].closed
+    assert server.matches() == 1
+
+
+def test_bad_faller_column():
+    server = columns_server.GameServer(server_fallers=False)
+    writer = _Writer()
+    match = _started_match(server, [writer])
+    player = match.players[0]
+    for command in ['F 0 1 2 3', 'F 7 1 2 3', 'F -1 1 2 3', 'F x 1 2 3',
+                    'F 3 1 2', 'F 3 1 2 3 4', 'F 3 1 22 3']:
+        server._command(match, player, command)
+        assert writer.data.endswith(f'ERROR bad command {command!r}\n'.encode())
+        assert not player.game.faller_exists()
+    server._command(match, player, 'F 6 1 2 3')
+    assert player.game.faller().col == 5